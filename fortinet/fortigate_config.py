@@ -0,0 +1,362 @@
+# Copyright (c) 2021 jsd-git
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Generates FortiGate CLI for bulk website allow lists and DHCP MAC blocks - the Python version of
+# massInputAllowWebsite.sh and massInputBlockMACDHCP.sh. CSVs are streamed a row at a time, entries are
+# normalized (lower case domains without scheme or path, aa:bb:cc:dd:ee:ff MACs) and deduplicated,
+# and when a saved copy of the running config is passed with --running only the entries the firewall
+# does not already have are printed. New reserved-address entries get indices that are not in use yet.
+#
+# Save the running config from the firewall (inside your vdom) with:
+#   show webfilter ftgd-local-rating      > ratings.txt
+#   show system dhcp server               > dhcp.txt
+#
+# Example usage:
+#   fortigate_config.py websites --file whitelist.csv --running ratings.txt | pbcopy
+#   fortigate_config.py macs --file file.csv --running dhcp.txt --interface lan | pbcopy
+
+import argparse
+import collections
+import csv
+import re
+import shlex
+import sys
+
+# ----------------------------------------------------------------------------------
+
+WEBFILTER_TABLE = 'webfilter ftgd-local-rating'
+DHCP_TABLE = 'system dhcp server'
+RESERVED_TABLE = 'reserved-address'
+DEFAULT_RATING = '142'
+DEFAULT_ACTION = 'block'
+RESERVED_DEFAULT_ACTION = 'reserved' # "show" leaves out settings that are at their default
+MAC_PATTERN = re.compile(r'^[0-9a-f]{12}$')
+MAC_SEPARATORS = re.compile(r'[\s:.\-]')
+DOMAIN_PATTERN = re.compile(r'^(?=.{1,253}$)([a-z0-9_]([a-z0-9_\-]{0,61}[a-z0-9_])?\.)+[a-z0-9_]([a-z0-9_\-]{0,61}[a-z0-9_])?$')
+
+
+# Function: AddEntryArguments(websites, macs)
+# Adds the flags that choose and shape the entries to the websites and macs subcommands. Shared with fortigate_push.py.
+# Void Return
+
+def AddEntryArguments(websites, macs):
+    websites.add_argument('--rating', dest='rating', type=str, default=DEFAULT_RATING, help='Rating category to set. "show webfilter ftgd-local-rating" shows the category of existing rules. (Default: {})'.format(DEFAULT_RATING))
+    macs.add_argument('--server-id', dest='server_id', type=str, help='The DHCP server to add the reserved addresses to ("edit 26").')
+    macs.add_argument('--interface', dest='interface', type=str, help='Pick the DHCP server serving this interface from the running config instead of giving --server-id.')
+    macs.add_argument('--start-index', dest='start_index', type=int, help='Lowest index to use for new reserved addresses. (Default: one above the highest index in use, or 1)')
+    macs.add_argument('--action', dest='action', type=str, default=DEFAULT_ACTION, help='Action to set on the reserved addresses. (Default: {})'.format(DEFAULT_ACTION))
+    for subparser in (websites, macs):
+        subparser.add_argument('--file', dest='filename', type=str, help='CSV with one entry per row.', required=True)
+        subparser.add_argument('--column', dest='column', type=str, default='0', help='Column holding the entries, as a number or a header name. (Default: 0, the first column)')
+
+
+# Function: ParseArguments()
+# Parses command line flags
+# Returns args object
+
+def ParseArguments():
+    parser = argparse.ArgumentParser(description="Prints the FortiGate CLI to add a CSV of websites to the local ratings or block a CSV of MACs from DHCP. Example usage: fortigate_config.py websites --file whitelist.csv --running ratings.txt")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    websites = subparsers.add_parser('websites', help='Rate a CSV of websites (the massInputAllowWebsite.sh replacement).')
+    websites.add_argument('--running', dest='running', type=str, help='Saved output of "show webfilter ftgd-local-rating". Websites that already have the rating are left out.')
+    macs = subparsers.add_parser('macs', help='Block a CSV of MAC addresses from DHCP (the massInputBlockMACDHCP.sh replacement).')
+    macs.add_argument('--running', dest='running', type=str, help='Saved output of "show system dhcp server". MACs that are already blocked are left out and new entries get unused indices.')
+    AddEntryArguments(websites, macs)
+    for subparser in (websites, macs):
+        subparser.add_argument('--vdom', dest='vdom', type=str, help='Wrap the output in "config vdom / edit VDOM". Without it, paste the output while inside your vdom.')
+        subparser.add_argument('--output', dest='output', type=str, help='File to write the CLI to. (Default: print it)')
+    args = parser.parse_args()
+    if args.command == 'macs' and not args.server_id and not (args.interface and args.running):
+        parser.error("macs needs --server-id, or --interface together with --running")
+    return args
+
+
+# Function: ReadColumn(filename, column)
+# Streams the values of one column of a CSV. column is a number, or a header name (the first row is then the header).
+# Yields strings
+
+def ReadColumn(filename, column='0'):
+    with open(filename, 'r', newline='', encoding='utf-8-sig') as file:
+        reader = csv.reader(file)
+        if column.isdigit():
+            index = int(column)
+        else:
+            header = [name.strip().lower() for name in next(reader, [])]
+            if column.lower() not in header:
+                sys.exit("{} has no column named {}".format(filename, column))
+            index = header.index(column.lower())
+        for row in reader:
+            if len(row) > index and row[index].strip() and not row[index].lstrip().startswith('#'):
+                yield row[index]
+
+
+# Function: NormalizeMAC(value)
+# Converts aa:bb:cc:dd:ee:ff, AA-BB-CC-DD-EE-FF, aabb.ccdd.eeff or aabbccddeeff into the form FortiOS shows (aa:bb:cc:dd:ee:ff).
+# Returns MAC string, or None if value is not a MAC address
+
+def NormalizeMAC(value):
+    digits = MAC_SEPARATORS.sub('', value.strip().strip('"')).lower()
+    if not MAC_PATTERN.match(digits):
+        return None
+    return ':'.join(digits[i:i + 2] for i in range(0, 12, 2))
+
+
+# Function: NormalizeDomain(value)
+# Reduces a website (https://WWW.Example.com:443/path, "example.com.") to the lower case host name FortiOS matches on.
+# Internationalized names are converted to their xn-- form.
+# Returns domain string, or None if value is not a host name
+
+def NormalizeDomain(value):
+    value = value.strip().strip('"').lower()
+    if '://' in value:
+        value = value.split('://', 1)[1]
+    value = re.split(r'[/?#]', value, 1)[0].rsplit('@', 1)[-1].split(':', 1)[0].strip('.')
+    try:
+        value = value.encode('idna').decode('ascii')
+    except UnicodeError:
+        return None
+    if not DOMAIN_PATTERN.match(value):
+        return None
+    return value
+
+
+# Function: ParseConfig(lines)
+# Parses FortiOS "show" output into tables. Each "config" block is keyed by its path, with the ids of the
+# enclosing "edit"s in it, e.g. "system dhcp server/26/reserved-address", and holds {edit id: {setting: [values]}}.
+# Returns dictionary of tables
+
+def ParseConfig(lines):
+    tables = collections.defaultdict(dict)
+    stack = [] # ('config', name) and ('edit', id) frames
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        try:
+            words = shlex.split(line)
+        except ValueError:
+            words = line.split()
+        keyword = words[0]
+        path = '/'.join(name for kind, name in stack)
+        if keyword == 'config' and len(words) > 1:
+            stack.append(('config', ' '.join(words[1:])))
+            tables['/'.join(name for kind, name in stack)]
+        elif keyword == 'edit' and len(words) > 1:
+            tables[path].setdefault(words[1], {})
+            stack.append(('edit', words[1]))
+        elif keyword in ('set', 'unset') and len(words) > 1 and stack:
+            if stack[-1][0] == 'edit':
+                entry = tables['/'.join(name for kind, name in stack[:-1])][stack[-1][1]]
+            else:
+                entry = tables[path].setdefault('', {})
+            if keyword == 'set':
+                entry[words[1]] = words[2:]
+            else:
+                entry.pop(words[1], None)
+        elif keyword == 'next' and stack and stack[-1][0] == 'edit':
+            stack.pop()
+        elif keyword == 'end':
+            while stack and stack.pop()[0] != 'config':
+                pass
+    return tables
+
+
+# Function: ReadConfig(filename)
+# Parses a saved "show" dump.
+# Returns dictionary of tables (see ParseConfig)
+
+def ReadConfig(filename):
+    with open(filename, 'r', encoding='utf-8', errors='replace') as file:
+        return ParseConfig(file)
+
+
+# Function: FindTable(tables, name, vdom)
+# Looks a table up by name whether the dump was taken inside a vdom or from the global context ("vdom/root/<name>").
+# Returns {edit id: settings} dictionary (empty if the dump does not have the table)
+
+def FindTable(tables, name, vdom=None):
+    found = {}
+    for path, table in tables.items():
+        if path == name or (path.startswith('vdom/') and path.endswith('/' + name) and (vdom is None or path == 'vdom/{}/{}'.format(vdom, name))):
+            found.update(table)
+    return found
+
+
+# Function: WebsiteDelta(values, existing, rating, stats)
+# Normalizes and deduplicates websites, dropping the ones existing already rates with rating.
+# existing maps domain -> the local rating entry from the running config. Counts go into stats.
+# Yields domain strings
+
+def WebsiteDelta(values, existing, rating, stats):
+    seen = set()
+    for value in values:
+        domain = NormalizeDomain(value)
+        if domain is None:
+            stats['invalid'] += 1
+            print("Skipping {!r}: not a website".format(value), file=sys.stderr)
+            continue
+        if domain in seen:
+            stats['duplicates'] += 1
+            continue
+        seen.add(domain)
+        entry = existing.get(domain)
+        if entry is not None and entry.get('rating') == [rating]:
+            stats['already configured'] += 1
+            continue
+        stats['updated' if entry is not None else 'new'] += 1
+        yield domain
+
+
+# Function: NextIndex(used, start)
+# Hands out reserved-address indices from start upwards, skipping the ones in used.
+# Yields integers
+
+def NextIndex(used, start):
+    index = start
+    while True:
+        if index not in used:
+            yield index
+        index += 1
+
+
+# Function: MACDelta(values, reserved, action, start_index, stats)
+# Normalizes and deduplicates MACs against the reserved addresses of one DHCP server. MACs that are
+# already reserved with another action keep their index and only get the action changed.
+# Yields (index, mac) tuples
+
+def MACDelta(values, reserved, action, start_index, stats):
+    existing = {}
+    used = set()
+    for index, entry in reserved.items():
+        if index.isdigit():
+            used.add(int(index))
+        mac = NormalizeMAC(' '.join(entry.get('mac', [])))
+        if mac is not None:
+            existing.setdefault(mac, (index, ' '.join(entry.get('action', [RESERVED_DEFAULT_ACTION]))))
+    if start_index is None:
+        start_index = max(used) + 1 if used else 1
+    indices = NextIndex(used, start_index)
+    seen = set()
+    for value in values:
+        mac = NormalizeMAC(value)
+        if mac is None:
+            stats['invalid'] += 1
+            print("Skipping {!r}: not a MAC address".format(value), file=sys.stderr)
+            continue
+        if mac in seen:
+            stats['duplicates'] += 1
+            continue
+        seen.add(mac)
+        if mac in existing:
+            index, current_action = existing[mac]
+            if current_action == action:
+                stats['already configured'] += 1
+                continue
+            stats['updated'] += 1
+            yield index, mac
+        else:
+            stats['new'] += 1
+            yield next(indices), mac
+
+
+# Function: FindDHCPServer(servers, interface)
+# Finds the id of the DHCP server that serves an interface.
+# Returns server id string
+
+def FindDHCPServer(servers, interface):
+    for server_id, settings in servers.items():
+        if settings.get('interface') == [interface]:
+            return server_id
+    sys.exit("No DHCP server for interface {} in the running config".format(interface))
+
+
+# Function: Block(header, body, footer)
+# Wraps the body lines in their config block, printing nothing at all when the body is empty.
+# Yields lines
+
+def Block(header, body, footer):
+    started = False
+    for line in body:
+        if not started:
+            started = True
+            for header_line in header:
+                yield header_line
+        yield line
+    if started:
+        for footer_line in footer:
+            yield footer_line
+
+
+# Function: WebsiteCommands(domains, rating)
+# Yields the "edit" stanza of each website.
+# Yields lines
+
+def WebsiteCommands(domains, rating):
+    for domain in domains:
+        yield 'edit "{}"'.format(domain)
+        yield 'set rating "{}"'.format(rating)
+        yield 'next'
+
+
+# Function: MACCommands(entries, action)
+# Yields the "edit" stanza of each reserved address.
+# Yields lines
+
+def MACCommands(entries, action):
+    for index, mac in entries:
+        yield 'edit {}'.format(index)
+        yield 'set mac {}'.format(mac)
+        yield 'set action {}'.format(action)
+        yield 'next'
+
+
+# Main Function
+
+def main():
+    args = ParseArguments()
+    tables = ReadConfig(args.running) if args.running else {}
+    stats = collections.Counter()
+    values = ReadColumn(args.filename, args.column)
+    if args.command == 'websites':
+        existing = FindTable(tables, WEBFILTER_TABLE, args.vdom)
+        body = WebsiteCommands(WebsiteDelta(values, existing, args.rating, stats), args.rating)
+        header, footer = ['config ' + WEBFILTER_TABLE], ['end']
+    else:
+        servers = FindTable(tables, DHCP_TABLE, args.vdom)
+        server_id = args.server_id or FindDHCPServer(servers, args.interface)
+        if args.running and server_id not in servers:
+            print("DHCP server {} is not in the running config, so existing reserved addresses can not be checked.".format(server_id), file=sys.stderr)
+        reserved = FindTable(tables, '{}/{}/{}'.format(DHCP_TABLE, server_id, RESERVED_TABLE), args.vdom)
+        body = MACCommands(MACDelta(values, reserved, args.action, args.start_index, stats), args.action)
+        header, footer = ['config ' + DHCP_TABLE, 'edit {}'.format(server_id), 'config ' + RESERVED_TABLE], ['end', 'next', 'end']
+    if args.vdom:
+        header, footer = ['config vdom', 'edit {}'.format(args.vdom)] + header, footer + ['end']
+    output = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        for line in Block(header, body, footer):
+            output.write(line + '\n')
+    finally:
+        if args.output:
+            output.close()
+    print("{} new, {} updated, {} already configured, {} duplicates, {} invalid".format(
+        stats['new'], stats['updated'], stats['already configured'], stats['duplicates'], stats['invalid']), file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+# Copyright (c) 2021 jsd-git
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Local stand-in for the FortiOS REST API, used to try fortigate_push.py (and measure its throughput)
+# without touching a firewall. Serves the web filter local ratings and the DHCP servers with their
+# reserved addresses, per vdom, and answers like FortiOS does (including error -5 for duplicates).
+# Example usage: fortigate_mock_server.py --port 8443 --token secret --ratings 1000 --reserved 600 --latency 0.01
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ----------------------------------------------------------------------------------
+
+ERROR_NOT_FOUND = -3
+ERROR_DUPLICATE = -5
+ERROR_INVALID = -651
+
+# Class: MockConfig
+# Settings for the generated firewall and how the server behaves.
+
+class MockConfig:
+    def __init__(self, token='mock-token', ratings=0, servers=1, reserved=0, latency=0.0, jitter=0.0,
+                 error_rate=0.0, throttle_rate=0.0, seed=1):
+        self.token = token                  # API token expected in "Authorization: Bearer ..." (None accepts anything)
+        self.ratings = ratings              # Local ratings that already exist in each vdom
+        self.servers = servers              # DHCP servers in each vdom, ids 26, 27, ... on interfaces lan, lan2, ...
+        self.reserved = reserved            # Reserved addresses that already exist on every DHCP server, ids from 650
+        self.latency = latency              # Seconds added to every response
+        self.jitter = jitter                # Up to this many extra seconds, picked at random
+        self.error_rate = error_rate        # Fraction of requests answered 502/503/504
+        self.throttle_rate = throttle_rate  # Fraction of requests answered 429
+        self.seed = seed
+
+
+# Class: MockFortiGate(config)
+# Generated firewall configuration plus request counters. Changes last for the rest of the run.
+
+class MockFortiGate:
+    def __init__(self, config):
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.lock = threading.Lock()
+        self.vdoms = {}
+        self.requests = 0
+
+    # Function: Vdom(name)
+    # Returns the {'ratings': {url: entry}, 'servers': {id: server}} state of a vdom, generating it on first use
+
+    def Vdom(self, name):
+        with self.lock:
+            if name not in self.vdoms:
+                ratings = {}
+                for x in range(1, self.config.ratings + 1):
+                    url = "existing{}.example.com".format(x)
+                    ratings[url] = {'url': url, 'status': 'enable', 'rating': '142'}
+                servers = {}
+                for x in range(self.config.servers):
+                    server_id = 26 + x
+                    reserved = {}
+                    for index in range(650, 650 + self.config.reserved):
+                        reserved[index] = {'id': index, 'mac': MockMAC(server_id, index), 'action': 'block'}
+                    servers[server_id] = {'id': server_id, 'interface': 'lan' if x == 0 else 'lan{}'.format(x + 1), 'reserved-address': reserved}
+                self.vdoms[name] = {'ratings': ratings, 'servers': servers}
+            return self.vdoms[name]
+
+    # Function: Inject()
+    # Picks whether to fail this request on purpose.
+    # Returns an error status code, or None
+
+    def Inject(self):
+        with self.lock:
+            self.requests += 1
+            roll = self.random.random()
+        if roll < self.config.throttle_rate:
+            return 429
+        if roll < self.config.throttle_rate + self.config.error_rate:
+            return self.random.choice((502, 503, 504))
+        return None
+
+
+# Function: MockMAC(server_id, index)
+# Returns a made up MAC address that is unique per server and index
+
+def MockMAC(server_id, index):
+    value = server_id * 65536 + index
+    return "02:00:00:{:02x}:{:02x}:{:02x}".format((value >> 16) & 255, (value >> 8) & 255, value & 255)
+
+
+# Function: Result(method, vdom, http_status, **fields)
+# Builds a response body shaped like the FortiOS ones.
+# Returns dictionary
+
+def Result(method, vdom, http_status, **fields):
+    body = {'http_method': method, 'vdom': vdom, 'status': 'success' if http_status == 200 else 'error', 'http_status': http_status}
+    body.update(fields)
+    return body
+
+
+# Function: ServerView(server)
+# Returns a DHCP server as the API lists it (reserved addresses as a list)
+
+def ServerView(server):
+    view = dict(server)
+    view['reserved-address'] = [dict(entry, q_origin_key=entry['id']) for entry in sorted(server['reserved-address'].values(), key=lambda entry: entry['id'])]
+    return view
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def Send(self, code, body=None, headers=None):
+        data = json.dumps(body if body is not None else {}).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def Handle(self, method):
+        fortigate = self.server.fortigate
+        config = fortigate.config
+        if config.latency or config.jitter:
+            time.sleep(config.latency + fortigate.random.random() * config.jitter)
+        length = int(self.headers.get('Content-Length') or 0)
+        data = self.rfile.read(length) if length else b''
+        if config.token is not None and self.headers.get('Authorization') != "Bearer {}".format(config.token):
+            return self.Send(401, Result(method, None, 401))
+        injected = fortigate.Inject()
+        if injected == 429:
+            return self.Send(429, Result(method, None, 429), {'Retry-After': '1'})
+        if injected:
+            return self.Send(injected, Result(method, None, injected))
+        path, _, query = self.path.partition('?')
+        vdom = urllib.parse.parse_qs(query).get('vdom', ['root'])[0]
+        handler, params = Route(method, path)
+        if handler is None:
+            return self.Send(404, Result(method, vdom, 404, error=ERROR_NOT_FOUND))
+        try:
+            body = json.loads(data) if data else {}
+        except ValueError:
+            return self.Send(400, Result(method, vdom, 400))
+        state = fortigate.Vdom(vdom)
+        with fortigate.lock:
+            code, result = handler(state, body, *[urllib.parse.unquote(param) for param in params])
+        result = Result(method, vdom, code, **result)
+        return self.Send(code, result)
+
+    def do_GET(self):
+        self.Handle('GET')
+
+    def do_POST(self):
+        self.Handle('POST')
+
+    def do_PUT(self):
+        self.Handle('PUT')
+
+    def do_DELETE(self):
+        self.Handle('DELETE')
+
+
+def ListRatings(state, body):
+    return 200, {'results': [dict(entry, q_origin_key=url) for url, entry in state['ratings'].items()]}
+
+def GetRating(state, body, url):
+    if url not in state['ratings']:
+        return 404, {'error': ERROR_NOT_FOUND}
+    return 200, {'results': [dict(state['ratings'][url], q_origin_key=url)]}
+
+def AddRating(state, body):
+    url = body.get('url')
+    if not url or 'rating' not in body:
+        return 500, {'error': ERROR_INVALID}
+    if url in state['ratings']:
+        return 500, {'error': ERROR_DUPLICATE}
+    state['ratings'][url] = {'url': url, 'status': body.get('status', 'enable'), 'rating': str(body['rating'])}
+    return 200, {'mkey': url}
+
+def SetRating(state, body, url):
+    if url not in state['ratings']:
+        return 404, {'error': ERROR_NOT_FOUND}
+    state['ratings'][url].update({key: str(value) for key, value in body.items() if key in ('rating', 'status')})
+    return 200, {'mkey': url}
+
+def DeleteRating(state, body, url):
+    if state['ratings'].pop(url, None) is None:
+        return 404, {'error': ERROR_NOT_FOUND}
+    return 200, {'mkey': url}
+
+def ListServers(state, body):
+    return 200, {'results': [ServerView(server) for server_id, server in sorted(state['servers'].items())]}
+
+def GetServer(state, body, server_id):
+    if int(server_id) not in state['servers']:
+        return 404, {'error': ERROR_NOT_FOUND}
+    return 200, {'results': [ServerView(state['servers'][int(server_id)])]}
+
+def AddReserved(state, body, server_id):
+    if int(server_id) not in state['servers']:
+        return 404, {'error': ERROR_NOT_FOUND}
+    reserved = state['servers'][int(server_id)]['reserved-address']
+    index = int(body.get('id') or 0) or max(list(reserved) + [0]) + 1 # id 0 lets FortiOS pick the next free one
+    if index in reserved:
+        return 500, {'error': ERROR_DUPLICATE}
+    if not re.match(r'^([0-9a-f]{2}:){5}[0-9a-f]{2}$', str(body.get('mac', '')).lower()):
+        return 500, {'error': ERROR_INVALID}
+    reserved[index] = {'id': index, 'mac': body['mac'].lower(), 'action': body.get('action', 'reserved')}
+    return 200, {'mkey': index}
+
+def SetReserved(state, body, server_id, index):
+    if int(server_id) not in state['servers'] or int(index) not in state['servers'][int(server_id)]['reserved-address']:
+        return 404, {'error': ERROR_NOT_FOUND}
+    state['servers'][int(server_id)]['reserved-address'][int(index)].update({key: value for key, value in body.items() if key in ('mac', 'action')})
+    return 200, {'mkey': int(index)}
+
+def DeleteReserved(state, body, server_id, index):
+    if int(server_id) not in state['servers'] or state['servers'][int(server_id)]['reserved-address'].pop(int(index), None) is None:
+        return 404, {'error': ERROR_NOT_FOUND}
+    return 200, {'mkey': int(index)}
+
+
+ROUTES = [
+    ('GET', r'^/api/v2/cmdb/webfilter/ftgd-local-rating/?$', ListRatings),
+    ('POST', r'^/api/v2/cmdb/webfilter/ftgd-local-rating/?$', AddRating),
+    ('GET', r'^/api/v2/cmdb/webfilter/ftgd-local-rating/([^/]+)$', GetRating),
+    ('PUT', r'^/api/v2/cmdb/webfilter/ftgd-local-rating/([^/]+)$', SetRating),
+    ('DELETE', r'^/api/v2/cmdb/webfilter/ftgd-local-rating/([^/]+)$', DeleteRating),
+    ('GET', r'^/api/v2/cmdb/system.dhcp/server/?$', ListServers),
+    ('GET', r'^/api/v2/cmdb/system.dhcp/server/(\d+)$', GetServer),
+    ('POST', r'^/api/v2/cmdb/system.dhcp/server/(\d+)/reserved-address/?$', AddReserved),
+    ('PUT', r'^/api/v2/cmdb/system.dhcp/server/(\d+)/reserved-address/(\d+)$', SetReserved),
+    ('DELETE', r'^/api/v2/cmdb/system.dhcp/server/(\d+)/reserved-address/(\d+)$', DeleteReserved),
+]
+
+
+# Function: Route(method, path)
+# Returns (handler, params) for a request, or (None, None) if nothing matches
+
+def Route(method, path):
+    for route_method, pattern, handler in ROUTES:
+        match = re.match(pattern, path)
+        if route_method == method and match:
+            return handler, match.groups()
+    return None, None
+
+
+# Function: StartMockServer(config, port)
+# Starts the mock server on a background thread. Port 0 picks a free port.
+# Returns (server, url) - call server.shutdown() to stop it
+
+def StartMockServer(config, port=0):
+    server = ThreadingHTTPServer(('127.0.0.1', port), MockHandler)
+    server.daemon_threads = True
+    server.fortigate = MockFortiGate(config)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, "http://127.0.0.1:{}".format(server.server_address[1])
+
+
+# Function: ParseArguments()
+# Parses command line flags
+# Returns args object
+
+def ParseArguments():
+    parser = argparse.ArgumentParser(description="Runs a local mock FortiOS REST API. Example usage: fortigate_mock_server.py --port 8443 --token secret --reserved 600")
+    parser.add_argument('--port', dest='port', type=int, default=8443, help='Port to listen on. (Default: 8443)')
+    parser.add_argument('--token', dest='token', type=str, default='mock-token', help='API token to expect. Pass an empty string to accept any. (Default: mock-token)')
+    parser.add_argument('--ratings', dest='ratings', type=int, default=0, help='Local ratings that already exist in each vdom. (Default: 0)')
+    parser.add_argument('--servers', dest='servers', type=int, default=1, help='DHCP servers in each vdom, ids from 26, the first on interface lan. (Default: 1)')
+    parser.add_argument('--reserved', dest='reserved', type=int, default=0, help='Reserved addresses already on each DHCP server, ids from 650. (Default: 0)')
+    parser.add_argument('--latency', dest='latency', type=float, default=0.0, help='Seconds added to every response. (Default: 0)')
+    parser.add_argument('--jitter', dest='jitter', type=float, default=0.0, help='Up to this many random extra seconds per response. (Default: 0)')
+    parser.add_argument('--error-rate', dest='error_rate', type=float, default=0.0, help='Fraction of requests answered 502/503/504. (Default: 0)')
+    parser.add_argument('--throttle-rate', dest='throttle_rate', type=float, default=0.0, help='Fraction of requests answered 429. (Default: 0)')
+    args = parser.parse_args()
+    return args
+
+
+# Main Function
+
+def main():
+    args = ParseArguments()
+    config = MockConfig(args.token or None, args.ratings, args.servers, args.reserved, args.latency, args.jitter,
+                        args.error_rate, args.throttle_rate)
+    server, url = StartMockServer(config, args.port)
+    print("Mock FortiOS API listening on {}".format(url))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        print("Served {} requests".format(server.fortigate.requests))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+# Copyright (c) 2021 jsd-git
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Pushes a CSV of websites (local ratings) or MACs (DHCP reserved-address blocks) straight to a FortiGate
+# through the FortiOS REST API instead of pasting CLI. The current entries are read from the API first,
+# so like fortigate_config.py only the missing or different entries are sent. Entries go out in batches
+# of concurrent requests with retries on throttling and gateway errors, and every entry's outcome can be
+# written to a results CSV. Try it offline against fortigate_mock_server.py.
+# Create the token under System > Administrators > REST API Admin.
+#
+# Example usage:
+#   fortigate_push.py --url https://fw.example.com --token $FORTIOS_TOKEN --vdom root websites --file whitelist.csv
+#   fortigate_push.py --url https://fw.example.com --token $FORTIOS_TOKEN macs --file file.csv --interface lan --results results.csv
+
+import argparse
+import collections
+import concurrent.futures
+import csv
+import itertools
+import os
+import sys
+import time
+import urllib.parse
+import requests
+from urllib3.util.retry import Retry
+from fortigate_config import (AddEntryArguments, FindDHCPServer, MACDelta, NormalizeDomain, ReadColumn,
+                              WebsiteDelta)
+
+# ----------------------------------------------------------------------------------
+
+RATINGS_PATH = '/api/v2/cmdb/webfilter/ftgd-local-rating'
+DHCP_PATH = '/api/v2/cmdb/system.dhcp/server'
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+RETRY_METHODS = frozenset(['GET', 'POST', 'PUT'])
+REQUEST_TIMEOUT = 60
+ERROR_DUPLICATE = -5 # FortiOS error code for "entry already exists"
+RESULT_COLUMNS = ['entry', 'index', 'method', 'status', 'http_status', 'error']
+
+
+# Class: PushError(http_status, error)
+# Raised when FortiOS refuses an entry.
+
+class PushError(Exception):
+    def __init__(self, http_status, error):
+        Exception.__init__(self, "HTTP {} (FortiOS error {})".format(http_status, error))
+        self.http_status = http_status
+        self.error = error
+
+
+# Function: ParseArguments()
+# Parses command line flags
+# Returns args object
+
+def ParseArguments():
+    parser = argparse.ArgumentParser(description="Pushes a CSV of websites or MACs to a FortiGate through the REST API. Example usage: fortigate_push.py --url https://fw.example.com --token TOKEN websites --file whitelist.csv")
+    parser.add_argument('--url', dest='url', type=str, help='The FortiGate URL. (Must include https://)', required=True)
+    parser.add_argument('--token', dest='token', type=str, default=os.environ.get('FORTIOS_TOKEN'), help='REST API admin token. (Default: $FORTIOS_TOKEN)')
+    parser.add_argument('--vdom', dest='vdom', type=str, default='root', help='The vdom to change. (Default: root)')
+    parser.add_argument('--insecure', dest='verify', action='store_false', help="Don't verify the firewall's certificate (self-signed certificates).")
+    parser.add_argument('--workers', dest='workers', type=int, default=4, help='Requests in flight at the same time. (Default: 4)')
+    parser.add_argument('--batch-size', dest='batch_size', type=int, default=200, help='Entries read, sent and reported on at a time. (Default: 200)')
+    parser.add_argument('--retries', dest='retries', type=int, default=5, help='Retries for throttled or failed requests. (Default: 5)')
+    parser.add_argument('--results', dest='results', type=str, help='CSV to write the outcome of every entry to.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    websites = subparsers.add_parser('websites', help='Rate a CSV of websites.')
+    macs = subparsers.add_parser('macs', help='Block a CSV of MAC addresses from DHCP.')
+    AddEntryArguments(websites, macs)
+    args = parser.parse_args()
+    if not args.token:
+        parser.error("--token or $FORTIOS_TOKEN is required")
+    if args.command == 'macs' and not args.server_id and not args.interface:
+        parser.error("macs needs --server-id or --interface")
+    return args
+
+
+# Function: CreateSession(token, verify, workers, retries)
+# Creates a session with the API token, a connection pool for every worker, and retries with backoff
+# on throttling (honoring Retry-After) and gateway errors.
+# Returns Session
+
+def CreateSession(token, verify=True, workers=4, retries=5):
+    session = requests.Session()
+    session.headers.update({'Authorization': 'Bearer {}'.format(token), 'Accept': 'application/json'})
+    session.verify = verify
+    retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=RETRY_STATUS_CODES, allowed_methods=RETRY_METHODS, raise_on_status=False)
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max(workers, 1), max_retries=retry)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    if not verify:
+        requests.packages.urllib3.disable_warnings()
+    return session
+
+
+# Function: Request(session, method, url, vdom, body)
+# Sends one API request.
+# Returns the response JSON, raises PushError if FortiOS refused it
+
+def Request(session, method, url, vdom, body=None):
+    response = session.request(method, url, params={'vdom': vdom}, json=body, timeout=REQUEST_TIMEOUT)
+    try:
+        result = response.json()
+    except ValueError:
+        result = {}
+    if response.status_code != 200:
+        raise PushError(response.status_code, result.get('error'))
+    return result
+
+
+# Function: FetchRatings(session, fortigate_url, vdom)
+# Reads the current local ratings, shaped like the parsed "show" output fortigate_config.py works with.
+# Returns {domain: {'rating': [rating]}} dictionary
+
+def FetchRatings(session, fortigate_url, vdom):
+    existing = {}
+    for entry in Request(session, 'GET', fortigate_url + RATINGS_PATH, vdom)['results']:
+        domain = NormalizeDomain(entry['url']) or entry['url']
+        existing[domain] = {'rating': [str(entry.get('rating'))]}
+    return existing
+
+
+# Function: FetchDHCPServers(session, fortigate_url, vdom)
+# Reads the DHCP servers and their reserved addresses, shaped like the parsed "show" output.
+# Returns ({server id: {'interface': [name]}}, {server id: {index: {'mac': [mac], 'action': [action]}}})
+
+def FetchDHCPServers(session, fortigate_url, vdom):
+    servers = {}
+    reserved = {}
+    for server in Request(session, 'GET', fortigate_url + DHCP_PATH, vdom)['results']:
+        server_id = str(server['id'])
+        servers[server_id] = {'interface': [server.get('interface')]}
+        reserved[server_id] = {str(entry['id']): {'mac': [entry.get('mac', '')], 'action': [entry.get('action', 'reserved')]}
+                               for entry in server.get('reserved-address', [])}
+    return servers, reserved
+
+
+# Function: PushRating(session, fortigate_url, vdom, domain, rating, exists)
+# Creates the local rating of a website, or updates it if it exists. A create that hits an existing
+# entry (e.g. a retried request that had gone through) is turned into an update.
+# Returns method used
+
+def PushRating(session, fortigate_url, vdom, domain, rating, exists):
+    body = {'url': domain, 'rating': rating, 'status': 'enable'}
+    if not exists:
+        try:
+            Request(session, 'POST', fortigate_url + RATINGS_PATH, vdom, body)
+            return 'POST'
+        except PushError as error:
+            if error.error != ERROR_DUPLICATE:
+                raise
+    Request(session, 'PUT', "{}{}/{}".format(fortigate_url, RATINGS_PATH, urllib.parse.quote(domain, safe='')), vdom, body)
+    return 'PUT'
+
+
+# Function: PushReservedAddress(session, fortigate_url, vdom, server_id, index, mac, action, exists)
+# Creates a reserved address at index on a DHCP server, or updates the existing one. A create that
+# hits an existing index is turned into an update of that index.
+# Returns method used
+
+def PushReservedAddress(session, fortigate_url, vdom, server_id, index, mac, action, exists):
+    body = {'id': int(index), 'mac': mac, 'action': action}
+    path = "{}{}/{}/reserved-address".format(fortigate_url, DHCP_PATH, server_id)
+    if not exists:
+        try:
+            Request(session, 'POST', path, vdom, body)
+            return 'POST'
+        except PushError as error:
+            if error.error != ERROR_DUPLICATE:
+                raise
+    Request(session, 'PUT', "{}/{}".format(path, index), vdom, body)
+    return 'PUT'
+
+
+# Function: Batches(entries, batch_size)
+# Splits a stream of entries into lists of batch_size.
+# Yields lists
+
+def Batches(entries, batch_size):
+    entries = iter(entries)
+    while True:
+        batch = list(itertools.islice(entries, max(batch_size, 1)))
+        if not batch:
+            return
+        yield batch
+
+
+# Function: PushEntries(push_one, entries, workers, batch_size, results_file)
+# Sends every entry with push_one(entry), `workers` at a time, a batch at a time. A failed entry is
+# recorded and the rest carry on. Progress is printed after every batch.
+# Returns Counter of outcomes
+
+def PushEntries(push_one, entries, workers=4, batch_size=200, results_file=None):
+    counts = collections.Counter()
+    writer = None
+    if results_file is not None:
+        writer = csv.DictWriter(results_file, fieldnames=RESULT_COLUMNS)
+        writer.writeheader()
+    start = time.monotonic()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        for batch in Batches(entries, batch_size):
+            futures = [(entry, executor.submit(push_one, entry)) for entry in batch]
+            for entry, future in futures:
+                index, value = entry if isinstance(entry, tuple) else ('', entry)
+                row = {'entry': value, 'index': index, 'method': '', 'status': 'ok', 'http_status': 200, 'error': ''}
+                try:
+                    row['method'] = future.result()
+                except PushError as error:
+                    row.update({'status': 'failed', 'http_status': error.http_status, 'error': error.error})
+                except requests.exceptions.RequestException as error:
+                    row.update({'status': 'failed', 'http_status': '', 'error': str(error)})
+                counts[row['status']] += 1
+                if row['status'] != 'ok':
+                    print("Failed {}: {}".format(value, row['error']), file=sys.stderr)
+                if writer is not None:
+                    writer.writerow(row)
+            if results_file is not None:
+                results_file.flush()
+            done = counts['ok'] + counts['failed']
+            elapsed = time.monotonic() - start
+            print("{} entries pushed ({} failed) - {:.1f} entries/s".format(done, counts['failed'], done / elapsed if elapsed else 0), file=sys.stderr)
+    return counts
+
+
+# Main Function
+
+def main():
+    args = ParseArguments()
+    fortigate_url = args.url.rstrip('/')
+    session = CreateSession(args.token, args.verify, args.workers, args.retries)
+    stats = collections.Counter()
+    values = ReadColumn(args.filename, args.column)
+    try:
+        if args.command == 'websites':
+            existing = FetchRatings(session, fortigate_url, args.vdom)
+        else:
+            servers, reserved = FetchDHCPServers(session, fortigate_url, args.vdom)
+    except (PushError, requests.exceptions.RequestException) as error:
+        sys.exit("Could not read the current config from {}: {}".format(fortigate_url, error))
+    if args.command == 'websites':
+        entries = WebsiteDelta(values, existing, args.rating, stats)
+        push_one = lambda domain: PushRating(session, fortigate_url, args.vdom, domain, args.rating, domain in existing)
+    else:
+        server_id = args.server_id or FindDHCPServer(servers, args.interface)
+        if server_id not in servers:
+            sys.exit("DHCP server {} does not exist in vdom {}".format(server_id, args.vdom))
+        current = reserved[server_id]
+        entries = MACDelta(values, current, args.action, args.start_index, stats)
+        push_one = lambda entry: PushReservedAddress(session, fortigate_url, args.vdom, server_id, entry[0], entry[1], args.action, str(entry[0]) in current)
+    start = time.monotonic()
+    results_file = open(args.results, 'w', newline='') if args.results else None
+    try:
+        counts = PushEntries(push_one, entries, args.workers, args.batch_size, results_file)
+    finally:
+        if results_file is not None:
+            results_file.close()
+    print("{} new, {} updated, {} already configured, {} duplicates, {} invalid".format(
+        stats['new'], stats['updated'], stats['already configured'], stats['duplicates'], stats['invalid']), file=sys.stderr)
+    print("Pushed {} entries, {} failed, in {:.1f}s".format(counts['ok'], counts['failed'], time.monotonic() - start))
+    if counts['failed']:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
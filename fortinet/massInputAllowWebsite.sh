@@ -2,6 +2,7 @@
 
 # This script will output the correctly formatted syntax for inputing a csv of websites to whitelist. You can pipe | this into pbcopy on a mac. Then paste it
 # into the firewall handling the filtering. Note: make sure you're under your vdom.
+# fortigate_config.py websites does the same with deduplication and only prints what the firewall is missing.
 
 echo "config webfilter ftgd-local-rating"
 cat whitelist.csv | while read line; do
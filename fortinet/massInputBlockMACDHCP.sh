@@ -2,6 +2,7 @@
 
 # This script will output the correctly formatted syntax for inputing a csv of mac-addresses to block from receiving DHCP reservations. You can pipe | this into pbcopy on a mac. Then paste it
 # into the firewall. Note: make sure you're under your vdom.
+# fortigate_config.py macs does the same with deduplication and only prints what the firewall is missing.
 
 echo "config system dhcp server"
 
@@ -0,0 +1,231 @@
+# Copyright (c) 2021 jsd-git
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Benchmarks the export, delete, backup and flush paths against jamf_mock_server.py so changes to
+# the fetch path can be measured without pointing anything at a production tenant.
+# Each run gets a fresh mock server process and a fresh client process, so peak RSS is per run.
+# Example usage: jamf_bench.py --sizes 100,1000,10000 --workers 8 --latency 0.02 --json results.json
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import queue
+import resource
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'jamf_backup'))
+from jamf_client import CreateSession
+from jamf_csv import SubsetsForColumns, WriteToCSV
+from jamf_metrics import ResponseSeconds
+from jamf_mock_server import MockConfig, StartMockServer
+from jamf_ratelimit import AdaptiveRateLimiter
+
+# ----------------------------------------------------------------------------------
+
+OPERATIONS = ['export', 'delete', 'backup', 'flush']
+
+
+# Function: ParseArguments()
+# Parses command line flags
+# Returns args object
+
+def ParseArguments():
+    parser = argparse.ArgumentParser(description="Benchmarks the JAMF scripts against a local mock server. Example usage: jamf_bench.py --sizes 100,1000 --workers 8 --latency 0.02")
+    parser.add_argument('--sizes', dest='sizes', type=str, default='100,1000,10000', help='Comma separated object counts to run at. (Default: 100,1000,10000)')
+    parser.add_argument('--operations', dest='operations', type=str, default=','.join(OPERATIONS), help='Comma separated operations to run. (Default: {})'.format(','.join(OPERATIONS)))
+    parser.add_argument('--workers', dest='workers', type=int, default=8, help='--workers passed to each script. (Default: 8)')
+    parser.add_argument('--latency', dest='latency', type=float, default=0.02, help='Mock server seconds per response. (Default: 0.02)')
+    parser.add_argument('--jitter', dest='jitter', type=float, default=0.0, help='Mock server random extra seconds per response. (Default: 0)')
+    parser.add_argument('--payload-size', dest='payload_size', type=int, default=1024, help='Bytes of filler in each document. (Default: 1024)')
+    parser.add_argument('--throttle-rate', dest='throttle_rate', type=float, default=0.0, help='Fraction of requests answered 429. (Default: 0)')
+    parser.add_argument('--error-rate', dest='error_rate', type=float, default=0.0, help='Fraction of requests answered 5xx. (Default: 0)')
+    parser.add_argument('--retry-after', dest='retry_after', type=int, default=1, help='Retry-After seconds sent with 429s. (Default: 1)')
+    parser.add_argument('--max-rate', dest='max_rate', type=float, default=10000.0, help='Rate limiter ceiling in requests per second. (Default: 10000, effectively unlimited)')
+    parser.add_argument('--run-timeout', dest='run_timeout', type=float, default=600, help='Give up on a run still going after this many seconds. 0 waits forever. (Default: 600)')
+    parser.add_argument('--json', dest='json_file', type=str, help='Also write the results to this JSON file.')
+    args = parser.parse_args()
+    return args
+
+
+# Function: ServeMock(config, url_queue)
+# Child process: runs the mock server until terminated, handing its url back through url_queue.
+# Void Return
+
+def ServeMock(config, url_queue):
+    server, url = StartMockServer(config)
+    url_queue.put(url)
+    while True:
+        time.sleep(3600)
+
+
+# Function: RunOperation(operation, url, workers, work_dir)
+# Runs one operation end to end with the scripts' own functions.
+# Void Return
+
+def RunOperation(operation, url, session, workers, work_dir):
+    if operation == 'export':
+        import jamf_export_apps
+        columns = list(jamf_export_apps.COLUMN_SUBSETS)
+        ids = jamf_export_apps.FetchIDS(url, session)
+        rows = jamf_export_apps.FetchAppInfo(url, session, ids, workers, subsets=SubsetsForColumns(jamf_export_apps.COLUMN_SUBSETS, columns))
+        WriteToCSV(rows, columns, os.path.join(work_dir, 'export.csv'))
+    elif operation == 'delete':
+        import jamf_delete_apps, jamf_export_apps
+        ids = [str(x) for x in jamf_export_apps.FetchIDS(url, session)]
+        journal = jamf_delete_apps.Journal(os.path.join(work_dir, 'delete.ndjson'))
+        jamf_delete_apps.DeleteApps(ids, url, session, journal, workers)
+        journal.Close()
+    elif operation == 'backup':
+        import jamf_backup_apps
+        ids = jamf_backup_apps.FetchIDS(url, session)
+        profiles = jamf_backup_apps.FetchConfigData(url, session, ids, workers)
+        jamf_backup_apps.BackupProfiles(profiles, jamf_backup_apps.CreateDirectory(os.path.join(work_dir, 'backup')))
+    elif operation == 'flush':
+        import jhs_clear_failures
+        ids = jhs_clear_failures.FetchGroupMembers(url, session, 1)
+        jhs_clear_failures.FlushDevices(url, session, ids, 'Failed', workers)
+
+
+# Function: RunScenario(operation, url, workers, max_rate, result_queue)
+# Child process: runs one operation against the mock server and reports wall time, request latencies and peak RSS.
+# Void Return
+
+def RunScenario(operation, url, workers, max_rate, result_queue):
+    latencies = []
+    session = CreateSession(url, 'bench', 'bench', workers, limiter=AdaptiveRateLimiter(max_rate, max_rate))
+    session.hooks['response'].append(lambda response, *args, **kwargs: latencies.append(ResponseSeconds(response)))
+    with tempfile.TemporaryDirectory() as work_dir:
+        start = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                RunOperation(operation, url, session, workers, work_dir)
+        except Exception as error:
+            result_queue.put({'error': "{}: {}".format(type(error).__name__, error)})
+            return
+        wall = time.perf_counter() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != 'darwin':
+        peak_rss *= 1024 # Linux reports kilobytes, macOS bytes
+    result_queue.put({'wall': wall, 'latencies': latencies, 'peak_rss': peak_rss})
+
+
+# Function: WaitForRun(client, result_queue, timeout)
+# Waits for the result of a client process, giving up if the client exits without one or is still
+# running after timeout seconds (0 waits forever).
+# Returns the run dictionary, or {'error': reason}
+
+def WaitForRun(client, result_queue, timeout):
+    deadline = time.monotonic() + timeout if timeout else None
+    while True:
+        try:
+            return result_queue.get(timeout=1)
+        except queue.Empty:
+            pass
+        if not client.is_alive():
+            try:
+                return result_queue.get(timeout=1)
+            except queue.Empty:
+                return {'error': "client exited with code {} without a result".format(client.exitcode)}
+        if deadline is not None and time.monotonic() > deadline:
+            client.terminate()
+            return {'error': "timed out after {}s".format(timeout)}
+
+
+# Function: Summarize(operation, size, run)
+# Turns the raw numbers from RunScenario into the reported metrics.
+# Returns result dictionary
+
+def Summarize(operation, size, run):
+    if 'error' in run:
+        return {'operation': operation, 'size': size, 'status': 'failed', 'error': run['error']}
+    latencies = sorted(run['latencies'])
+    result = {'operation': operation, 'size': size, 'status': 'ok', 'requests': len(latencies), 'wall_s': round(run['wall'], 3),
+              'requests_per_s': round(len(latencies) / run['wall'], 1) if run['wall'] else 0,
+              'peak_rss_mb': round(run['peak_rss'] / 1048576, 1)}
+    if len(latencies) >= 2:
+        quantiles = statistics.quantiles(latencies, n=100)
+        result.update({'p50_ms': round(quantiles[49] * 1000, 1), 'p95_ms': round(quantiles[94] * 1000, 1), 'p99_ms': round(quantiles[98] * 1000, 1)})
+    return result
+
+
+# Function: Benchmark(operation, size, args)
+# Starts a mock server sized for one run, runs the operation in a fresh process and tears both down.
+# Returns result dictionary
+
+def Benchmark(operation, size, args):
+    context = multiprocessing.get_context('spawn')
+    config = MockConfig(apps=size, profiles=size, groups=1, devices=size, latency=args.latency, jitter=args.jitter,
+                        payload_size=args.payload_size, throttle_rate=args.throttle_rate, error_rate=args.error_rate,
+                        retry_after=args.retry_after, group_flush=False)
+    url_queue = context.Queue()
+    server = context.Process(target=ServeMock, args=(config, url_queue), daemon=True)
+    server.start()
+    try:
+        url = url_queue.get(timeout=30)
+        result_queue = context.Queue()
+        client = context.Process(target=RunScenario, args=(operation, url, args.workers, args.max_rate, result_queue))
+        client.start()
+        run = WaitForRun(client, result_queue, args.run_timeout)
+        client.join()
+    finally:
+        server.terminate()
+        server.join()
+    return Summarize(operation, size, run)
+
+
+# Function: PrintResults(results)
+# Prints the results as a table.
+# Void Return
+
+def PrintResults(results):
+    columns = ['operation', 'size', 'status', 'requests', 'wall_s', 'requests_per_s', 'p50_ms', 'p95_ms', 'p99_ms', 'peak_rss_mb']
+    print("  ".join("{:>14}".format(column) for column in columns))
+    for result in results:
+        print("  ".join("{:>14}".format(str(result.get(column, '-'))) for column in columns))
+
+
+# Main Function
+
+def main():
+    args = ParseArguments()
+    results = []
+    for operation in args.operations.split(','):
+        for size in [int(x) for x in args.sizes.split(',')]:
+            result = Benchmark(operation, size, args)
+            results.append(result)
+            if result['status'] == 'ok':
+                print("{} x {}: {}s".format(operation, size, result['wall_s']), file=sys.stderr)
+            else:
+                print("{} x {}: failed - {}".format(operation, size, result['error']), file=sys.stderr)
+    PrintResults(results)
+    if args.json_file:
+        with open(args.json_file, 'w') as file:
+            json.dump({'workers': args.workers, 'latency': args.latency, 'results': results}, file, indent=2)
+    if any(result['status'] != 'ok' for result in results):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+# Copyright (c) 2021 jsd-git
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# On-disk cache of JAMF API object documents shared by every script in this repo, so a
+# pipeline like export -> review -> delete only downloads each object once.
+# Entries live at <cache_dir>/<server>/<endpoint>/<id>.json, expire after max_age seconds and the
+# least recently used entries are evicted once there are more than max_entries.
+
+import json
+import os
+import re
+import threading
+import time
+import urllib.parse
+from jamf_decode import Loads
+
+# ----------------------------------------------------------------------------------
+
+DEFAULT_MAX_AGE = 3600
+DEFAULT_MAX_ENTRIES = 50000
+
+
+# Class: ResponseCache(cache_dir, max_age, max_entries)
+# Disk backed TTL + LRU cache keyed by JAMF server, API endpoint and object id. Safe to share between threads.
+
+class ResponseCache:
+    def __init__(self, cache_dir, max_age=DEFAULT_MAX_AGE, max_entries=DEFAULT_MAX_ENTRIES):
+        self.cache_dir = cache_dir
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self.entries = len(self.ListEntries())
+
+    # Function: Path(jss_url, endpoint, object_id)
+    # Returns the file path an entry is stored at: <cache_dir>/<server>/<endpoint>/<id>.json, so tenants
+    # sharing a cache directory never see each other's objects
+
+    def Path(self, jss_url, endpoint, object_id):
+        return os.path.join(self.cache_dir, HostKey(jss_url), endpoint, "{}.json".format(str(object_id)))
+
+    # Function: Get(jss_url, endpoint, object_id)
+    # Looks an object up in the cache. Expired entries are removed and count as a miss.
+    # Returns the cached document, or None
+
+    def Get(self, jss_url, endpoint, object_id):
+        path = self.Path(jss_url, endpoint, object_id)
+        try:
+            with open(path, 'rb') as file:
+                entry = Loads(file.read())
+        except (IOError, ValueError):
+            return None
+        if time.time() - entry['fetched'] > self.max_age:
+            self.Invalidate(jss_url, endpoint, object_id)
+            return None
+        try:
+            os.utime(path) # Marks the entry as recently used
+        except OSError:
+            pass
+        return entry['body']
+
+    # Function: Put(jss_url, endpoint, object_id, body)
+    # Stores a full document in the cache, evicting the least recently used entries if the cache is full.
+    # Void Return
+
+    def Put(self, jss_url, endpoint, object_id, body):
+        path = self.Path(jss_url, endpoint, object_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = "{}.{}.tmp".format(path, threading.get_ident())
+        with open(temp_path, 'w') as file:
+            json.dump({'fetched': time.time(), 'body': body}, file)
+        existed = os.path.exists(path)
+        os.replace(temp_path, path)
+        with self.lock:
+            if not existed:
+                self.entries += 1
+            if self.entries > self.max_entries:
+                self.Evict()
+
+    # Function: Invalidate(jss_url, endpoint, object_id)
+    # Removes an object from the cache, e.g. after it has been deleted from JAMF.
+    # Void Return
+
+    def Invalidate(self, jss_url, endpoint, object_id):
+        try:
+            os.remove(self.Path(jss_url, endpoint, object_id))
+        except OSError:
+            return
+        with self.lock:
+            self.entries -= 1
+
+    # Function: ListEntries()
+    # Returns a list of (last_used, path) for every entry in the cache
+
+    def ListEntries(self):
+        entries = []
+        for host in os.scandir(self.cache_dir):
+            if not host.is_dir():
+                continue
+            for endpoint in os.scandir(host.path):
+                if not endpoint.is_dir():
+                    continue
+                for entry in os.scandir(endpoint.path):
+                    if entry.name.endswith('.json'):
+                        entries.append((entry.stat().st_mtime, entry.path))
+        return entries
+
+    # Function: Evict()
+    # Drops the least recently used entries until the cache is 10% below max_entries.
+    # Caller must hold self.lock.
+    # Void Return
+
+    def Evict(self):
+        entries = sorted(self.ListEntries())
+        target = int(self.max_entries * 0.9)
+        for last_used, path in entries[:max(len(entries) - target, 0)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.entries = min(len(entries), target)
+
+
+# Function: HostKey(jss_url)
+# Turns a JAMF URL into a directory name for its server, e.g. "sub.jamfcloud.com" or "127.0.0.1_8080".
+# Returns string
+
+def HostKey(jss_url):
+    return re.sub(r'[^\w.-]', '_', urllib.parse.urlparse(jss_url).netloc.lower())
+
+
+# Function: AddCacheArguments(parser)
+# Adds the --cache-dir, --max-age, --cache-size and --refresh flags to a script's argument parser.
+# Void Return
+
+def AddCacheArguments(parser):
+    parser.add_argument('--cache-dir', dest='cache_dir', type=str, help='Directory to cache JAMF API responses in. Shared between scripts so objects are only downloaded once; objects are always cached whole, even by exports that only need some sections. (Default: no cache)')
+    parser.add_argument('--max-age', dest='max_age', type=int, default=DEFAULT_MAX_AGE, help='Seconds a cached response stays valid. (Default: {})'.format(DEFAULT_MAX_AGE))
+    parser.add_argument('--cache-size', dest='cache_size', type=int, default=DEFAULT_MAX_ENTRIES, help='Maximum number of cached responses to keep. (Default: {})'.format(DEFAULT_MAX_ENTRIES))
+    parser.add_argument('--refresh', dest='refresh', action='store_true', help='Ignore cached responses and always fetch fresh data. Fresh data is still written to the cache.')
+
+
+# Function: CacheFromArgs(args)
+# Builds the cache described by the flags from AddCacheArguments.
+# Returns ResponseCache, or None when no --cache-dir was given
+
+def CacheFromArgs(args):
+    if not args.cache_dir:
+        return None
+    return ResponseCache(args.cache_dir, args.max_age, args.cache_size)
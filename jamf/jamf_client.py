@@ -0,0 +1,180 @@
+# Copyright (c) 2021 jsd-git
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Shared JAMF API client. Every script in this repo builds its session here so they all
+# get the same connection pool, retry policy and token handling.
+# Usage: from jamf_client import CreateSession
+
+import datetime
+import threading
+import time
+import requests
+from urllib3.util.retry import Retry
+from jamf_decode import DecodeResponse
+from jamf_metrics import Stage
+from jamf_ratelimit import AdaptiveRateLimiter, RateLimitedAdapter
+
+# ----------------------------------------------------------------------------------
+
+JSS_HEADERS = {'Content-Type':'application/json','Accept':'application/json'}
+TOKEN_ENDPOINT = "/api/v1/auth/token"
+TOKEN_REFRESH_MARGIN = 60 # Seconds before expiry that a token gets replaced
+RETRY_STATUS_CODES = (500, 502, 504) # 429 and 503 are retried by the rate limiter
+RETRY_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+REQUEST_TIMEOUT = 60
+
+
+# Class: JamfTokenAuth(jss_url, username, password)
+# requests auth handler that trades the username and password for a Jamf Pro bearer token once,
+# then sends that token on every call. The token is refreshed shortly before it expires and again
+# if the server ever answers 401. Servers without the token endpoint fall back to basic auth.
+# Safe to share between threads.
+
+class JamfTokenAuth(requests.auth.AuthBase):
+    def __init__(self, jss_url, username, password):
+        self.jss_url = jss_url
+        self.username = username
+        self.password = password
+        self.lock = threading.Lock()
+        self.token = None
+        self.expires_at = 0
+        self.use_basic = False
+
+    def __call__(self, request):
+        if self.use_basic:
+            return requests.auth.HTTPBasicAuth(self.username, self.password)(request)
+        request.headers['Authorization'] = "Bearer {}".format(self.Token())
+        request.register_hook('response', self.HandleUnauthorized)
+        return request
+
+    # Function: Token()
+    # Returns a valid bearer token, fetching a new one if there is none or it is about to expire.
+    # Returns token string
+
+    def Token(self, force=False):
+        with self.lock:
+            if force or self.token is None or time.monotonic() >= self.expires_at - TOKEN_REFRESH_MARGIN:
+                self.FetchToken()
+            return self.token
+
+    # Function: FetchToken()
+    # Queries the Jamf Pro API for a new bearer token with basic auth.
+    # Void Return
+
+    def FetchToken(self):
+        response = requests.post(self.jss_url + TOKEN_ENDPOINT, auth=(self.username, self.password), headers=JSS_HEADERS, timeout=REQUEST_TIMEOUT)
+        if response.status_code == 404:
+            print("Token auth is not available on this server, falling back to basic auth.")
+            self.use_basic = True
+            self.token = ""
+            self.expires_at = float('inf')
+            return
+        response.raise_for_status()
+        token_json = response.json()
+        self.token = token_json['token']
+        self.expires_at = time.monotonic() + SecondsUntil(token_json.get('expires'))
+
+    # Function: HandleUnauthorized(response)
+    # Response hook: when a call comes back 401 the token is replaced and the call is sent once more.
+    # Returns response
+
+    def HandleUnauthorized(self, response, **kwargs):
+        if response.status_code != 401 or self.use_basic or getattr(response.request, 'token_retried', False):
+            return response
+        stale_token = response.request.headers.get('Authorization', '')
+        with self.lock:
+            if stale_token == "Bearer {}".format(self.token):
+                self.FetchToken()
+        response.content
+        response.close()
+        retry = response.request.copy()
+        retry.token_retried = True
+        if self.use_basic:
+            requests.auth.HTTPBasicAuth(self.username, self.password)(retry)
+        else:
+            retry.headers['Authorization'] = "Bearer {}".format(self.token)
+        new_response = response.connection.send(retry, **kwargs)
+        new_response.history.append(response)
+        new_response.request = retry
+        return new_response
+
+
+# Function: SecondsUntil(expires)
+# Converts the "expires" value of a token response (ISO 8601 string or epoch milliseconds) to seconds from now.
+# Returns float
+
+def SecondsUntil(expires):
+    if expires is None:
+        return 20 * 60 # Jamf's default token lifetime
+    if isinstance(expires, (int, float)):
+        return expires / 1000 - time.time()
+    expires_at = datetime.datetime.fromisoformat(expires.replace('Z', '+00:00'))
+    return (expires_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+
+
+# Function: CreateSession(jss_url, username, password, pool_size, retries, backoff, limiter)
+# Creates a session with token authentication, requried headers, a connection pool that holds
+# pool_size keep-alive connections (match this to the number of workers), automatic retries
+# with exponential backoff on connection errors and transient 5xx responses, and an adaptive
+# rate limiter shared by every thread using the session that backs off on 429/503.
+# Every request times out after REQUEST_TIMEOUT seconds unless the caller passes its own timeout.
+# Returns Session
+
+def CreateSession(jss_url, username, password, pool_size=10, retries=3, backoff=0.5, limiter=None):
+    s = requests.Session()
+    s.auth = JamfTokenAuth(jss_url, username, password)
+    s.headers.update(JSS_HEADERS)
+    retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=RETRY_STATUS_CODES, allowed_methods=RETRY_METHODS, raise_on_status=False, respect_retry_after_header=False)
+    adapter = RateLimitedAdapter(limiter or AdaptiveRateLimiter(), pool_connections=1, pool_maxsize=max(pool_size, 1), pool_block=True, max_retries=retry, timeout=REQUEST_TIMEOUT)
+    s.mount('https://', adapter)
+    s.mount('http://', adapter)
+    return s
+
+
+# Function: FetchObject(session, jss_url, endpoint, object_id, cache, refresh, subsets)
+# Queries the Classic API for a single object, e.g. endpoint "mobiledeviceapplications".
+# With subsets (e.g. ['General', 'Scope']) only those sections are requested through /subset/..., which
+# keeps large sections like payloads or self service icons off the wire.
+# When a ResponseCache is passed the cached copy is used if there is one (unless refresh is set)
+# and freshly downloaded documents are added to it. With a cache the full document is always
+# downloaded, even when subsets are given: a cached subset can't stand in for the full documents
+# jamf_delete_apps.py and jamf_backup_apps.py need, so an export -> delete pipeline would download
+# everything twice. The trade-off is larger responses on the caching run.
+# Returns the decoded JSON document (the full document when it came from a cache)
+
+def FetchObject(session, jss_url, endpoint, object_id, cache=None, refresh=False, subsets=None):
+    if cache is not None and not refresh:
+        with Stage('cache'):
+            jss_json = cache.Get(jss_url, endpoint, object_id)
+        if jss_json is not None:
+            return jss_json
+    if cache is not None:
+        subsets = None
+    jss = jss_url + "/JSSResource/{}/id/{}".format(endpoint, str(object_id))
+    if subsets:
+        jss += "/subset/" + "&".join(subsets)
+    jss_response = session.get(jss)
+    jss_response.raise_for_status()
+    with Stage('decode'):
+        jss_json = DecodeResponse(jss_response)
+    if cache is not None:
+        with Stage('cache'):
+            cache.Put(jss_url, endpoint, object_id, jss_json)
+    return jss_json
@@ -0,0 +1,92 @@
+# Copyright (c) 2021 jsd-git
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Shared CSV helpers for the export scripts. Import from the other scripts in
+# this directory: from jamf_csv import ReadExportedIDs, WriteToCSV
+
+import csv
+import itertools
+import os
+import requests
+from jamf_metrics import Stage
+
+# ----------------------------------------------------------------------------------
+
+# Function: SubsetsForColumns(column_subsets, column_headers)
+# Works out which Classic API subsets are needed to fill the given CSV columns, so adding a column widens the request.
+# column_subsets maps each column to its subset, e.g. COLUMN_SUBSETS from jamf_export_apps.
+# Returns sorted list of subset names
+
+def SubsetsForColumns(column_subsets, column_headers):
+    return sorted(set(column_subsets[column] for column in column_headers))
+
+
+# Function: ReadExportedIDs(filename)
+# Reads the ids already written to a partially finished export so they can be skipped.
+# A trailing half-written row (from a crash mid-write) is cut off the file. The file is read as
+# UTF-8, the same encoding WriteToCSV uses, so the truncation offset is counted in the file's bytes.
+# Returns set of id strings
+
+def ReadExportedIDs(filename):
+    exported = set()
+    try:
+        with open(filename, 'r+', newline='', encoding='utf-8') as csvfile:
+            contents = csvfile.read()
+            if contents and not contents.endswith('\n'):
+                csvfile.seek(0)
+                csvfile.truncate(len(contents[:contents.rfind('\n') + 1].encode('utf-8')))
+            csvfile.seek(0)
+            for line in csv.DictReader(csvfile):
+                exported.add(line['id'])
+    except IOError:
+        pass
+    return exported
+
+
+# Function: WriteToCSV(rows, column_headers, filename, resume)
+# Writes to CSV one row at a time, flushing each row to disk as soon as it is written so a crash loses nothing.
+# rows can be any iterable, e.g. the generator from FetchAppInfo or FetchConfInfo.
+# With resume the rows are appended to an existing export instead of starting a new file.
+# The first row is fetched before the file is opened, so a failed login or id listing leaves the previous
+# export untouched. Request errors are raised rather than reported as I/O errors.
+# Returns number of rows written
+
+def WriteToCSV(rows, column_headers, filename, resume=False):
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is not None:
+        rows = itertools.chain([first], rows)
+    written = 0
+    try:
+        append = resume and os.path.exists(filename) and os.path.getsize(filename) > 0
+        with open(filename, 'a' if append else 'w', newline='', encoding='utf-8') as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=column_headers, extrasaction='ignore')
+            if not append:
+                writer.writeheader()
+            for data in rows:
+                with Stage('write_csv'):
+                    writer.writerow(data)
+                    csvfile.flush()
+                written += 1
+    except requests.exceptions.RequestException:
+        raise
+    except IOError:
+        print("I/O Error")
+    return written
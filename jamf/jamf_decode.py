@@ -0,0 +1,154 @@
+# Copyright (c) 2021 jsd-git
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Fast decoding of JAMF responses. Bodies are parsed straight from the response bytes (skipping the
+# str copy and the charset detection requests does for .text) with orjson or msgspec when one is
+# installed and the standard json module otherwise. Exported objects are kept as small __slots__
+# records instead of dictionaries; they answer record['name'] and record.get('name') so the CSV
+# writer, the mirror and the other sinks take them unchanged.
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+# ----------------------------------------------------------------------------------
+
+if orjson is not None:
+    DECODER = 'orjson'
+    _loads = orjson.loads
+elif msgspec is not None:
+    DECODER = 'msgspec'
+    _loads = msgspec.json.Decoder().decode
+else:
+    DECODER = 'json'
+    _loads = json.loads
+
+
+# Function: Loads(data)
+# Parses a JSON document from bytes (or str) with the fastest decoder available.
+# Returns the decoded document
+
+def Loads(data):
+    return _loads(data)
+
+
+# Function: DecodeResponse(response)
+# Parses the JSON body of a requests response from its raw bytes.
+# Returns the decoded document
+
+def DecodeResponse(response):
+    return _loads(response.content)
+
+
+# Class: Record()
+# Base for the typed export records. Fields that were not filled in (e.g. a section left out by
+# /subset/) are simply unset, and read as missing.
+
+class Record(object):
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return hasattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def keys(self):
+        return [field for field in self.__slots__ if hasattr(self, field)]
+
+    def __repr__(self):
+        return "{}({})".format(type(self).__name__, ", ".join("{}={!r}".format(field, getattr(self, field)) for field in self.keys()))
+
+
+# Class: AppRecord()
+# The exported fields of one Mobile Device App.
+
+class AppRecord(Record):
+    __slots__ = ('id', 'name', 'display_name', 'bundle_id', 'version', 'scope', 'scope_all', 'scope_all_users',
+                 'vpp_on', 'vpp_licenses', 'vpp_licenses_used', 'vpp_licenses_remaining')
+
+
+# Class: ProfileRecord()
+# The exported fields of one Mobile Device Configuration Profile.
+
+class ProfileRecord(Record):
+    __slots__ = ('id', 'name', 'scope', 'scope_all', 'scope_all_users')
+
+
+# Function: DecodeApp(jss_json)
+# Builds an AppRecord from a Classic API mobile_device_application document (full or subset).
+# Returns AppRecord
+
+def DecodeApp(jss_json):
+    app = jss_json['mobile_device_application']
+    record = AppRecord()
+    general = app.get('general')
+    if general is not None:
+        record.id = general['id']
+        record.name = general['name']
+        record.display_name = general['display_name']
+        record.bundle_id = general['bundle_id']
+        record.version = general['version']
+    scope = app.get('scope')
+    if scope is not None:
+        record.scope = scope['mobile_device_groups']
+        record.scope_all = scope['all_mobile_devices']
+        record.scope_all_users = scope['all_jss_users']
+    vpp = app.get('vpp')
+    if vpp is not None:
+        record.vpp_on = vpp['assign_vpp_device_based_licenses']
+        if record.vpp_on == True:
+            record.vpp_licenses = vpp['total_vpp_licenses']
+            record.vpp_licenses_used = vpp['used_vpp_licenses']
+            record.vpp_licenses_remaining = vpp['remaining_vpp_licenses']
+    return record
+
+
+# Function: DecodeProfile(jss_json)
+# Builds a ProfileRecord from a Classic API configuration_profile document (full or subset).
+# Returns ProfileRecord
+
+def DecodeProfile(jss_json):
+    profile = jss_json['configuration_profile']
+    record = ProfileRecord()
+    general = profile.get('general')
+    if general is not None:
+        record.id = general['id']
+        record.name = general['name']
+    scope = profile.get('scope')
+    if scope is not None:
+        record.scope = scope['mobile_device_groups']
+        record.scope_all = scope['all_mobile_devices']
+        record.scope_all_users = scope['all_jss_users']
+    return record
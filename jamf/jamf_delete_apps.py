@@ -17,12 +17,17 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
-
 import csv
-import requests
 import json
+import os
+import threading
 import argparse
 import datetime
+from jamf_cache import AddCacheArguments, CacheFromArgs
+from jamf_client import CreateSession, FetchObject
+from jamf_fetch import FetchConcurrent
+from jamf_metrics import AddProfileArguments, EnableProfiling, Stage
+from jamf_ratelimit import AddRateLimitArguments, RateLimiterFromArgs
 
 # ----------------------------------------------------------------------------------
 
@@ -30,37 +35,89 @@ import datetime
 # Parses command line flags
 # Returns args object
 def ParseArguments():
-    parser = argparse.ArgumentParser(description="This program will take a csv of app ids expored from jamf_gather_apps.py, back them up to a text file, and delete them from Jamf.Example usage: jamf_delete_apps.py --url https://sub.jamfcloud.com --file delete.csv --user testinguser --pass supersecret")
+    parser = argparse.ArgumentParser(description="This program will take a csv of app ids expored from jamf_gather_apps.py, back them up to a journal file, and delete them from Jamf.Example usage: jamf_delete_apps.py --url https://sub.jamfcloud.com --file delete.csv --user testinguser --pass supersecret")
     parser.add_argument('--url', dest='jssurl', type=str, help='Your JAMF URL. (Must include https://) Example: https://sub.jamfcloud.com', required=True)
-    parser.add_argument('--file', dest='filename', type=str, help='The filename you would like to source the appids for deleteion from.', required=True)
+    parser.add_argument('--file', dest='filename', type=str, help='The filename you would like to source the appids for deleteion from. Optional with --resume.')
     parser.add_argument('--user', dest='username', type=str, help='Your JAMF username.', required=True)
     parser.add_argument('--pass',dest='password', type=str, help='Your JAMF password.', required=True)
+    parser.add_argument('--workers', dest='workers', type=int, default=1, help='Number of apps to back up and delete at the same time. (Default: 1)')
+    parser.add_argument('--journal', dest='journal', type=str, help='NDJSON journal to write backups and delete results to. (Default: <timestamp>.backup.ndjson)')
+    parser.add_argument('--resume', dest='resume', type=str, help='Journal of an interrupted run to continue. Apps it already deleted are skipped.')
+    AddCacheArguments(parser)
+    AddRateLimitArguments(parser)
+    AddProfileArguments(parser)
     args = parser.parse_args()
+    if not args.filename and not args.resume:
+        parser.error("--file is required unless --resume is given")
     return args
 
 
-# Function: CreateSession(username, password)
-# Creates a session with authentication credentials and requried headers.
-# Returns Session
-
-def CreateSession(username, password):
-    jss_headers = {'Content-Type':'application/json','Accept':'application/json'}
-    s = requests.Session()
-    s.auth = (username, password)
-    s.headers.update(jss_headers)
-    return s
+# Class: Journal(filename)
+# Append-only NDJSON write-ahead journal. Every line is one JSON record:
+#   {"event": "start", "ids": [...]}                   - the apps a run set out to delete
+#   {"event": "backup", "id": 5, "data": {...}}        - full app json, fsynced before the DELETE is sent
+#   {"event": "deleted", "id": 5, "status": 200}       - the DELETE succeeded
+#   {"event": "failed", "id": 5, "error": "..."}       - the backup or DELETE failed, the app was left alone
+# Safe to share between threads.
+
+class Journal:
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.file = open(filename, 'a')
+        if self.file.tell() > 0 and not EndsWithNewline(filename):
+            self.file.write("\n") # Ends a line left half-written by a crash
+
+    # Function: Append(record, sync)
+    # Writes one record. With sync the record is forced to disk before returning.
+    # Void Return
+
+    def Append(self, record, sync=False):
+        line = json.dumps(record) + "\n"
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+            if sync:
+                os.fsync(self.file.fileno())
+
+    def Close(self):
+        self.file.close()
+
+
+# Function: EndsWithNewline(filename)
+# Returns True if the last byte of a file is a newline
+
+def EndsWithNewline(filename):
+    with open(filename, 'rb') as file:
+        file.seek(-1, os.SEEK_END)
+        return file.read(1) == b"\n"
+
+
+# Function: ReadJournal(filename)
+# Reads a journal from a previous run. A half-written last line from a crash is ignored.
+# Returns (ids, backups, deleted) - the ids the run set out to delete, a dictionary of id -> backed up json
+# and the set of ids that were deleted. Ids are strings.
+
+def ReadJournal(filename):
+    ids = []
+    seen = set()
+    backups = {}
+    deleted = set()
+    with open(filename, 'r') as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record['event'] == 'start':
+                ids.extend(str(x) for x in record['ids'] if str(x) not in seen)
+                seen.update(str(x) for x in record['ids'])
+            elif record['event'] == 'backup':
+                backups[str(record['id'])] = record['data']
+            elif record['event'] == 'deleted':
+                deleted.add(str(record['id']))
+    return ids, backups, deleted
 
-# Function: WriteArrayFile(array, filename)
-# Writes an array to a file of choice.
-# Returns Void
-def WriteArrayFile(array, filename):
-    try:
-        with open(filename, 'w', newline='') as file:
-            for item in array:
-                 file.write("%s\n" % item)
-
-    except IOError:
-        print("I/O Error")
 
 # Function: ReadCSV(filename)
 # Reads csv and extracts array of Application IDs
@@ -75,18 +132,43 @@ def ReadCSV(filename):
         print("I/O Error")
     return data
 
-# Function: DeleteApps(array, url, session)
-# Queries API for specific applications based on array of app ids, then backs their json data up to a *.backup file in the case of accidental deletion then deletes the apps
-# Returns Void
-def DeleteApps(array, url, session):
-    backup = []
-    for x in range(len(array)):
-        jss_url = url + "/JSSResource/mobiledeviceapplications/id/{}".format(str(array[x]))
-        jss_response = session.get(jss_url)
-        jss_json = json.loads(jss_response.text)
-        backup.append(jss_json)
-        delete = session.delete(jss_url)
-    WriteArrayFile(backup, "{}.backup".format(str(datetime.datetime.now().timestamp())))
+# Function: DeleteApp(app_id, url, session, journal, backups, cache, refresh)
+# Backs a single app up to the journal (skipped if backups already holds it from an earlier run) then deletes it.
+# A 404 on the DELETE means an earlier run already removed it and counts as deleted.
+# Returns the DELETE status code
+def DeleteApp(app_id, url, session, journal, backups, cache=None, refresh=False):
+    if app_id not in backups:
+        jss_json = FetchObject(session, url, "mobiledeviceapplications", app_id, cache, refresh)
+        with Stage('journal'):
+            journal.Append({'event': 'backup', 'id': app_id, 'data': jss_json}, sync=True)
+    jss_url = url + "/JSSResource/mobiledeviceapplications/id/{}".format(str(app_id))
+    delete = session.delete(jss_url)
+    if delete.status_code != 404:
+        delete.raise_for_status()
+    if cache is not None:
+        cache.Invalidate(url, "mobiledeviceapplications", app_id)
+    journal.Append({'event': 'deleted', 'id': app_id, 'status': delete.status_code})
+    return delete.status_code
+
+# Function: DeleteApps(array, url, session, journal, workers, backups, cache, refresh)
+# Queries API for specific applications based on array of app ids, then backs their json data up to the journal in the case of accidental deletion then deletes the apps
+# `workers` apps are handled at the same time. Each app's backup is on disk before its DELETE is sent, so an interrupted run can always be restored and resumed.
+# Apps already in the response cache (e.g. from jamf_export_apps.py) are backed up from there unless refresh is set
+# Returns (deleted, failed) counts
+def DeleteApps(array, url, session, journal, workers=1, backups=None, cache=None, refresh=False):
+    backups = backups or {}
+    deleted = 0
+    failed = 0
+    delete_one = lambda app_id: DeleteApp(app_id, url, session, journal, backups, cache, refresh)
+    for app_id, status, error in FetchConcurrent(delete_one, array, workers):
+        if error is not None:
+            failed += 1
+            journal.Append({'event': 'failed', 'id': app_id, 'error': str(error)})
+            print("Failed to delete app ID: {} - {}".format(str(app_id), error))
+            continue
+        deleted += 1
+    print("Deleted {} apps, {} failed.".format(deleted, failed))
+    return deleted, failed
 
 
 # Main Function
@@ -97,9 +179,24 @@ def main():
     basejss = args.jssurl
     user = args.username
     password = args.password
-    session = CreateSession(user,password)
-    data = ReadCSV(csv_file)
-    DeleteApps(data,basejss,session)
+    session = CreateSession(basejss, user, password, args.workers, limiter=RateLimiterFromArgs(args))
+    EnableProfiling(session, args)
+    backups = {}
+    if args.resume:
+        data, backups, done = ReadJournal(args.resume)
+        if csv_file:
+            data = ReadCSV(csv_file)
+        data = [x for x in data if x not in done]
+        print("Resuming from {}: {} apps already deleted, {} left.".format(args.resume, len(done), len(data)))
+        journal = Journal(args.resume)
+    else:
+        data = ReadCSV(csv_file)
+        journal = Journal(args.journal or "{}.backup.ndjson".format(str(datetime.datetime.now().timestamp())))
+    journal.Append({'event': 'start', 'ids': data}, sync=True)
+    try:
+        DeleteApps(data, basejss, session, journal, args.workers, backups, CacheFromArgs(args), args.refresh)
+    finally:
+        journal.Close()
 
     
 if __name__ == "__main__":
@@ -18,13 +18,26 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-import csv
-import requests
-import json
 import argparse
+from jamf_cache import AddCacheArguments, CacheFromArgs
+from jamf_client import CreateSession, FetchObject
+from jamf_csv import ReadExportedIDs, SubsetsForColumns, WriteToCSV
+from jamf_decode import DecodeApp, DecodeResponse
+from jamf_fetch import FetchConcurrent, ReportFailures
+from jamf_ids import AddPagingArguments, IterIDs
+from jamf_metrics import AddProfileArguments, EnableProfiling, Stage
+from jamf_ratelimit import AddRateLimitArguments, RateLimiterFromArgs
+from jamf_scope_index import AddScopeIndexArguments, ScopeIndexFromArgs
 
 # ----------------------------------------------------------------------------------
 
+# Which Classic API subset each CSV column is read from. FetchApp only requests the subsets the columns need.
+COLUMN_SUBSETS = {
+    'id': 'General', 'name': 'General', 'display_name': 'General', 'bundle_id': 'General', 'version': 'General',
+    'scope': 'Scope', 'scope_all': 'Scope', 'scope_all_users': 'Scope',
+    'vpp_on': 'VPP', 'vpp_licenses': 'VPP', 'vpp_licenses_used': 'VPP', 'vpp_licenses_remaining': 'VPP',
+}
+
 # Function: ParseArguments()
 # Creates a session with authentication credentials and requried headers.
 # Returns Session
@@ -34,22 +47,28 @@ def ParseArguments():
     parser.add_argument('--file', dest='filename', type=str, help='The filename you would like to save the export as.', required=True)
     parser.add_argument('--user', dest='username', type=str, help='Your JAMF username.', required=True)
     parser.add_argument('--pass',dest='password', type=str, help='Your JAMF password.', required=True)
+    parser.add_argument('--workers', dest='workers', type=int, default=1, help='Number of app details to fetch at the same time. (Default: 1)')
+    parser.add_argument('--resume', dest='resume', action='store_true', help='Continue a partially written export, skipping the ids already in --file.')
+    AddPagingArguments(parser)
+    AddCacheArguments(parser)
+    AddRateLimitArguments(parser)
+    AddProfileArguments(parser)
+    AddScopeIndexArguments(parser)
     args = parser.parse_args()
     return args
 
 
-# Function: CreateSession(username, password)
-# Creates a session with authentication credentials and requried headers.
-# Returns Session
-
-def CreateSession(username, password):
-    jss_headers = {'Content-Type':'application/json','Accept':'application/json'}
-    s = requests.Session()
-    s.auth = (username, password)
-    s.headers.update(jss_headers)
-    return s
-
+# Function: FetchList(jss_url, session)
+# Queries JAMF API for the list of all Mobile Apps. Each entry holds the cheap fields the list endpoint
+# returns (id, name, and on current servers bundle_id and version).
+# Returns full_app_list array
 
+def FetchList(jss_url, session):
+    jss = jss_url + "/JSSResource/mobiledeviceapplications"
+    jss_response = session.get(jss)
+    jss_response.raise_for_status()
+    jss_json = DecodeResponse(jss_response)
+    return jss_json["mobile_device_applications"]
 
 # Function: FetchIDS(jss_url, session)
 # Queries JAMF API for all Mobile Apps and extracts their app ids into an array.
@@ -57,57 +76,37 @@ def CreateSession(username, password):
 
 def FetchIDS(jss_url, session):
     app_ids = []
-    jss = jss_url + "/JSSResource/mobiledeviceapplications"
-    jss_response = session.get(jss)
-    jss_json = json.loads(jss_response.text)
-    full_app_list = jss_json["mobile_device_applications"]
+    full_app_list = FetchList(jss_url, session)
     for x in range(len(full_app_list)):
         current_app = full_app_list[x]
         app_ids.append(current_app['id'])
     return app_ids
 
-# Function: FetchAppInfo(jss_url, session, app_ids)
-# Queries JAMF API for all Detailed App Info and compiles an array of specific data points.
-# Returns apps_detailed array
-
-def FetchAppInfo(jss_url, session, app_ids):
-    apps_detailed = []
-    for x in range(len(app_ids)):
-        jss = jss_url + "/JSSResource/mobiledeviceapplications/id/{}".format(str(app_ids[x]))
-        jss_response = session.get(jss)
-        jss_json = json.loads(jss_response.text)
-        device_profile = {}
-        device_profile['id'] = jss_json['mobile_device_application']['general']['id']
-        device_profile['name'] = jss_json['mobile_device_application']['general']['name']
-        device_profile['display_name'] = jss_json['mobile_device_application']['general']['display_name']
-        device_profile['bundle_id'] = jss_json['mobile_device_application']['general']['bundle_id']
-        device_profile['version'] = jss_json['mobile_device_application']['general']['version']
-        device_profile['scope'] = jss_json['mobile_device_application']['scope']['mobile_device_groups']
-        device_profile['scope_all'] = jss_json['mobile_device_application']['scope']['all_mobile_devices']
-        device_profile['scope_all_users'] = jss_json['mobile_device_application']['scope']['all_jss_users']
-        device_profile['vpp_on'] = jss_json['mobile_device_application']['vpp']['assign_vpp_device_based_licenses']
-        if device_profile['vpp_on'] == True:
-            device_profile['vpp_licenses'] = jss_json['mobile_device_application']['vpp']['total_vpp_licenses']
-            device_profile['vpp_licenses_used'] = jss_json['mobile_device_application']['vpp']['used_vpp_licenses']
-            device_profile['vpp_licenses_remaining'] = jss_json['mobile_device_application']['vpp']['remaining_vpp_licenses']
-        apps_detailed.append(device_profile)
-    return apps_detailed
-
-
-
-# Function: WriteToCSV(apps_detailed, column_headers, filename)
-# Writes to CSV
-# Void Return
-
-def WriteToCSV(apps_detailed, column_headers, filename):
-    try:
-        with open(filename, 'w', newline='') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=column_headers)
-            writer.writeheader()
-            for data in apps_detailed:
-                writer.writerow(data)
-    except IOError:
-        print("I/O Error")
+# Function: FetchApp(jss_url, session, app_id, cache, refresh, subsets)
+# Queries JAMF API for the Detailed App Info of a single app and picks out the data points we export.
+# Only the sections listed in subsets are requested (all of them when subsets is None).
+# Returns device_profile AppRecord (reads like a dictionary: device_profile['name'], device_profile.get('scope'))
+
+def FetchApp(jss_url, session, app_id, cache=None, refresh=False, subsets=None):
+    jss_json = FetchObject(session, jss_url, "mobiledeviceapplications", app_id, cache, refresh, subsets)
+    with Stage('decode'):
+        return DecodeApp(jss_json)
+
+# Function: FetchAppInfo(jss_url, session, app_ids, workers, cache, refresh, subsets)
+# Queries JAMF API for all Detailed App Info, `workers` apps at a time, and yields the specific data points of each one as soon as it arrives.
+# Apps come out in the same order as app_ids. Apps that fail to fetch are reported at the end and left out.
+# Yields device_profile AppRecords
+
+def FetchAppInfo(jss_url, session, app_ids, workers=1, cache=None, refresh=False, subsets=None):
+    failures = []
+    fetch_one = lambda app_id: FetchApp(jss_url, session, app_id, cache, refresh, subsets)
+    for app_id, device_profile, error in FetchConcurrent(fetch_one, app_ids, workers):
+        if error is not None:
+            failures.append((app_id, error))
+            continue
+        yield device_profile
+    ReportFailures(failures, "apps")
+
 
 
 # Main Function
@@ -119,10 +118,20 @@ def main():
     basejss = args.jssurl
     user = args.username
     password = args.password
-    session = CreateSession(user,password)
-    ids = FetchIDS(basejss, session)
-    app_data = FetchAppInfo(basejss, session, ids)
-    WriteToCSV(app_data, csv_columns, csv_file)
+    session = CreateSession(basejss, user, password, args.workers, limiter=RateLimiterFromArgs(args))
+    EnableProfiling(session, args)
+    ids = IterIDs(basejss, session, "mobiledeviceapplications", args.page_size)
+    if args.resume:
+        exported = ReadExportedIDs(csv_file)
+        ids = (x for x in ids if str(x) not in exported)
+        print("Resuming export: {} already exported.".format(len(exported)))
+    app_data = FetchAppInfo(basejss, session, ids, args.workers, CacheFromArgs(args), args.refresh, SubsetsForColumns(COLUMN_SUBSETS, csv_columns))
+    scope_index = ScopeIndexFromArgs(args)
+    if scope_index is not None:
+        app_data = scope_index.Track('apps', app_data)
+    WriteToCSV(app_data, csv_columns, csv_file, args.resume)
+    if scope_index is not None:
+        scope_index.Write(args.scope_index, args.resume)
     
 if __name__ == "__main__":
     main()
@@ -18,13 +18,25 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-import csv
-import requests
-import json
 import argparse
+from jamf_cache import AddCacheArguments, CacheFromArgs
+from jamf_client import CreateSession, FetchObject
+from jamf_csv import ReadExportedIDs, SubsetsForColumns, WriteToCSV
+from jamf_decode import DecodeProfile, DecodeResponse
+from jamf_fetch import FetchConcurrent, ReportFailures
+from jamf_ids import AddPagingArguments, IterIDs
+from jamf_metrics import AddProfileArguments, EnableProfiling, Stage
+from jamf_ratelimit import AddRateLimitArguments, RateLimiterFromArgs
+from jamf_scope_index import AddScopeIndexArguments, ScopeIndexFromArgs
 
 # ----------------------------------------------------------------------------------
 
+# Which Classic API subset each CSV column is read from. FetchConf only requests the subsets the columns need.
+COLUMN_SUBSETS = {
+    'id': 'General', 'name': 'General',
+    'scope': 'Scope', 'scope_all': 'Scope', 'scope_all_users': 'Scope',
+}
+
 # Function: ParseArguments()
 # Creates a session with authentication credentials and requried headers.
 # Returns Session
@@ -34,22 +46,27 @@ def ParseArguments():
     parser.add_argument('--file', dest='filename', type=str, help='The filename you would like to save the export as.', required=True)
     parser.add_argument('--user', dest='username', type=str, help='Your JAMF username.', required=True)
     parser.add_argument('--pass',dest='password', type=str, help='Your JAMF password.', required=True)
+    parser.add_argument('--workers', dest='workers', type=int, default=1, help='Number of profile details to fetch at the same time. (Default: 1)')
+    parser.add_argument('--resume', dest='resume', action='store_true', help='Continue a partially written export, skipping the ids already in --file.')
+    AddPagingArguments(parser)
+    AddCacheArguments(parser)
+    AddRateLimitArguments(parser)
+    AddProfileArguments(parser)
+    AddScopeIndexArguments(parser)
     args = parser.parse_args()
     return args
 
 
-# Function: CreateSession(username, password)
-# Creates a session with authentication credentials and requried headers.
-# Returns Session
-
-def CreateSession(username, password):
-    jss_headers = {'Content-Type':'application/json','Accept':'application/json'}
-    s = requests.Session()
-    s.auth = (username, password)
-    s.headers.update(jss_headers)
-    return s
-
+# Function: FetchList(jss_url, session)
+# Queries JAMF API for the list of all Mobile Config Profiles (id and name of each).
+# Returns full_conf_list array
 
+def FetchList(jss_url, session):
+    jss = jss_url + "/JSSResource/configurationprofiles"
+    jss_response = session.get(jss)
+    jss_response.raise_for_status()
+    jss_json = DecodeResponse(jss_response)
+    return jss_json["configuration_profiles"]
 
 # Function: FetchIDS(jss_url, session)
 # Queries JAMF API for all Mobile Config Profiles and extracts their config ids into an array.
@@ -57,49 +74,37 @@ def CreateSession(username, password):
 
 def FetchIDS(jss_url, session):
     conf_ids = []
-    jss = jss_url + "/JSSResource/configurationprofiles"
-    jss_response = session.get(jss)
-    jss_json = json.loads(jss_response.text)
-    full_conf_list = jss_json["configuration_profiles"]
+    full_conf_list = FetchList(jss_url, session)
     for x in range(len(full_conf_list)):
         current_config = full_conf_list[x]
         conf_ids.append(current_config['id'])
     return conf_ids
 
-# Function: FetchConfInfo(jss_url, session, conf_ids)
-# Queries JAMF API for all Detailed Mobile Config Info and compiles an array of specific data points.
-# Returns conf_detailed array
-
-def FetchConfInfo(jss_url, session, conf_ids):
-    conf_detailed = []
-    for x in range(len(conf_ids)):
-        jss = jss_url + "/JSSResource/configurationprofiles/id/{}".format(str(conf_ids[x]))
-        jss_response = session.get(jss)
-        jss_json = json.loads(jss_response.text)
-        device_profile = {}
-        device_profile['id'] = jss_json['configuration_profile']['general']['id']
-        device_profile['name'] = jss_json['configuration_profile']['general']['name']
-        device_profile['scope'] = jss_json['configuration_profile']['scope']['mobile_device_groups']
-        device_profile['scope_all'] = jss_json['configuration_profile']['scope']['all_mobile_devices']
-        device_profile['scope_all_users'] = jss_json['configuration_profile']['scope']['all_jss_users']
-        conf_detailed.append(device_profile)
-    return conf_detailed
-
-
-
-# Function: WriteToCSV(conf_detailed, column_headers, filename)
-# Writes to CSV
-# Void Return
-
-def WriteToCSV(conf_detailed, column_headers, filename):
-    try:
-        with open(filename, 'w', newline='') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=column_headers)
-            writer.writeheader()
-            for data in conf_detailed:
-                writer.writerow(data)
-    except IOError:
-        print("I/O Error")
+# Function: FetchConf(jss_url, session, conf_id, cache, refresh, subsets)
+# Queries JAMF API for the Detailed Mobile Config Info of a single profile and picks out the data points we export.
+# Only the sections listed in subsets are requested (all of them when subsets is None).
+# Returns device_profile ProfileRecord (reads like a dictionary: device_profile['name'], device_profile.get('scope'))
+
+def FetchConf(jss_url, session, conf_id, cache=None, refresh=False, subsets=None):
+    jss_json = FetchObject(session, jss_url, "configurationprofiles", conf_id, cache, refresh, subsets)
+    with Stage('decode'):
+        return DecodeProfile(jss_json)
+
+# Function: FetchConfInfo(jss_url, session, conf_ids, workers, cache, refresh, subsets)
+# Queries JAMF API for all Detailed Mobile Config Info, `workers` profiles at a time, and yields the specific data points of each one as soon as it arrives.
+# Profiles come out in the same order as conf_ids. Profiles that fail to fetch are reported at the end and left out.
+# Yields device_profile ProfileRecords
+
+def FetchConfInfo(jss_url, session, conf_ids, workers=1, cache=None, refresh=False, subsets=None):
+    failures = []
+    fetch_one = lambda conf_id: FetchConf(jss_url, session, conf_id, cache, refresh, subsets)
+    for conf_id, device_profile, error in FetchConcurrent(fetch_one, conf_ids, workers):
+        if error is not None:
+            failures.append((conf_id, error))
+            continue
+        yield device_profile
+    ReportFailures(failures, "configuration profiles")
+
 
 
 # Main Function
@@ -111,10 +116,20 @@ def main():
     basejss = args.jssurl
     user = args.username
     password = args.password
-    session = CreateSession(user,password)
-    ids = FetchIDS(basejss, session)
-    conf_data = FetchConfInfo(basejss, session, ids)
-    WriteToCSV(conf_data, csv_columns, csv_file)
+    session = CreateSession(basejss, user, password, args.workers, limiter=RateLimiterFromArgs(args))
+    EnableProfiling(session, args)
+    ids = IterIDs(basejss, session, "configurationprofiles", args.page_size)
+    if args.resume:
+        exported = ReadExportedIDs(csv_file)
+        ids = (x for x in ids if str(x) not in exported)
+        print("Resuming export: {} already exported.".format(len(exported)))
+    conf_data = FetchConfInfo(basejss, session, ids, args.workers, CacheFromArgs(args), args.refresh, SubsetsForColumns(COLUMN_SUBSETS, csv_columns))
+    scope_index = ScopeIndexFromArgs(args)
+    if scope_index is not None:
+        conf_data = scope_index.Track('profiles', conf_data)
+    WriteToCSV(conf_data, csv_columns, csv_file, args.resume)
+    if scope_index is not None:
+        scope_index.Write(args.scope_index, args.resume)
     
 if __name__ == "__main__":
     main()
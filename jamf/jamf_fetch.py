@@ -0,0 +1,76 @@
+# Copyright (c) 2021 jsd-git
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Shared helpers for fetching many JAMF objects at once. Import from the other
+# scripts in this directory: from jamf_fetch import FetchConcurrent
+
+import collections
+import concurrent.futures
+
+# ----------------------------------------------------------------------------------
+
+# Function: FetchConcurrent(fetch_one, ids, workers)
+# Calls fetch_one(id) for every id using a pool of at most `workers` threads.
+# No more than 2 * workers calls are in flight at once, so memory stays bounded
+# no matter how many ids are passed in. Results come back in the same order as ids.
+# An exception raised for one id is caught and handed back instead of aborting the run.
+# Yields (id, result, error) tuples - error is None on success, result is None on failure
+
+def FetchConcurrent(fetch_one, ids, workers=1):
+    if workers <= 1:
+        for item_id in ids:
+            try:
+                yield item_id, fetch_one(item_id), None
+            except Exception as error:
+                yield item_id, None, error
+        return
+
+    window = workers * 2
+    pending = collections.deque()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        for item_id in ids:
+            pending.append((item_id, executor.submit(fetch_one, item_id)))
+            if len(pending) >= window:
+                yield _Collect(*pending.popleft())
+        while pending:
+            yield _Collect(*pending.popleft())
+
+
+# Function: _Collect(item_id, future)
+# Waits for a single future and converts it into an (id, result, error) tuple.
+# Returns tuple
+
+def _Collect(item_id, future):
+    try:
+        return item_id, future.result(), None
+    except Exception as error:
+        return item_id, None, error
+
+
+# Function: ReportFailures(failures, kind)
+# Prints a summary of the ids that could not be fetched.
+# Void Return
+
+def ReportFailures(failures, kind):
+    if not failures:
+        return
+    print("Failed to fetch {} of the requested {}:".format(len(failures), kind))
+    for item_id, error in failures:
+        print("  ID: {} - {}".format(str(item_id), error))
@@ -0,0 +1,213 @@
+# Copyright (c) 2021 jsd-git
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Runs the export and flush scripts across many JAMF instances at once. Every tenant runs in its own
+# process with its own session, worker count and rate limit, writes to its own output directory, and
+# a consolidated summary is printed (and saved as summary.json) at the end.
+# Example usage: jamf_fleet.py --config tenants.json --operations export-apps,export-profiles,clear-failures --output-dir fleet
+#
+# Example tenants.json - passwords can be given inline ("password") or read from an environment variable ("password_env"):
+# {
+#     "defaults": {"user": "api_user", "workers": 4, "max_rate": 50},
+#     "tenants": [
+#         {"name": "north", "url": "https://north.jamfcloud.com", "password_env": "JAMF_NORTH_PASS", "flush_group": 185},
+#         {"name": "south", "url": "https://south.jamfcloud.com", "password_env": "JAMF_SOUTH_PASS", "workers": 8}
+#     ]
+# }
+
+import argparse
+import concurrent.futures
+import contextlib
+import json
+import os
+import sys
+import time
+import traceback
+import jamf_export_apps
+import jamf_export_config_profiles
+import jhs_clear_failures
+from jamf_csv import SubsetsForColumns, WriteToCSV
+from jamf_client import CreateSession
+from jamf_ids import DEFAULT_PAGE_SIZE, IterIDs
+from jamf_ratelimit import DEFAULT_MAX_RATE, DEFAULT_START_RATE, AdaptiveRateLimiter
+from jamf_scope_index import ScopeIndex
+
+# ----------------------------------------------------------------------------------
+
+OPERATIONS = ['export-apps', 'export-profiles', 'clear-failures']
+TENANT_DEFAULTS = {'workers': 4, 'start_rate': DEFAULT_START_RATE, 'max_rate': DEFAULT_MAX_RATE, 'page_size': DEFAULT_PAGE_SIZE,
+                   'flush_status': 'Failed', 'flush_mode': 'auto'}
+
+
+# Function: ParseArguments()
+# Parses command line flags
+# Returns args object
+
+def ParseArguments():
+    parser = argparse.ArgumentParser(description="Runs JAMF exports and command flushes across every tenant in a config file in parallel. Example usage: jamf_fleet.py --config tenants.json --operations export-apps,clear-failures")
+    parser.add_argument('--config', dest='config', type=str, help='JSON file listing the tenants. See the top of this script for the format.', required=True)
+    parser.add_argument('--operations', dest='operations', type=str, default='export-apps,export-profiles', help='Comma separated operations to run on each tenant: {}. (Default: export-apps,export-profiles)'.format(', '.join(OPERATIONS)))
+    parser.add_argument('--output-dir', dest='output_dir', type=str, default='fleet', help='Each tenant writes to <output-dir>/<tenant name>/. (Default: fleet)')
+    parser.add_argument('--processes', dest='processes', type=int, default=0, help='Tenants to run at the same time. (Default: all of them)')
+    parser.add_argument('--tenants', dest='tenants', type=str, help='Comma separated tenant names to run. (Default: all tenants in the config)')
+    args = parser.parse_args()
+    for operation in args.operations.split(','):
+        if operation not in OPERATIONS:
+            parser.error("unknown operation {}".format(operation))
+    return args
+
+
+# Function: LoadTenants(filename, names)
+# Reads the tenant config, applying "defaults" to each tenant and resolving password_env.
+# Returns array of tenant dictionaries
+
+def LoadTenants(filename, names=None):
+    with open(filename, 'r') as file:
+        config = json.load(file)
+    tenants = []
+    for entry in config['tenants']:
+        tenant = dict(TENANT_DEFAULTS)
+        tenant.update(config.get('defaults', {}))
+        tenant.update(entry)
+        if names and tenant['name'] not in names:
+            continue
+        if 'password_env' in tenant:
+            tenant['password'] = os.environ.get(tenant['password_env'])
+        for key in ('name', 'url', 'user', 'password'):
+            if not tenant.get(key):
+                sys.exit("Tenant {} is missing {}".format(tenant.get('name', '?'), key))
+        tenants.append(tenant)
+    return tenants
+
+
+# Function: ExportApps(tenant, session, output_dir)
+# Runs the jamf_export_apps.py export for one tenant and adds the apps to the tenant's scope_index.json.
+# Returns result dictionary
+
+def ExportApps(tenant, session, output_dir):
+    columns = list(jamf_export_apps.COLUMN_SUBSETS)
+    filename = os.path.join(output_dir, 'apps.csv')
+    ids = IterIDs(tenant['url'], session, "mobiledeviceapplications", tenant['page_size'])
+    rows = jamf_export_apps.FetchAppInfo(tenant['url'], session, ids, tenant['workers'], subsets=SubsetsForColumns(jamf_export_apps.COLUMN_SUBSETS, columns))
+    scope_index = ScopeIndex()
+    rows = scope_index.Track('apps', rows)
+    result = {'rows': WriteToCSV(rows, columns, filename), 'file': filename}
+    scope_index.Write(os.path.join(output_dir, 'scope_index.json'))
+    return result
+
+
+# Function: ExportProfiles(tenant, session, output_dir)
+# Runs the jamf_export_config_profiles.py export for one tenant and adds the profiles to the tenant's scope_index.json.
+# Returns result dictionary
+
+def ExportProfiles(tenant, session, output_dir):
+    columns = list(jamf_export_config_profiles.COLUMN_SUBSETS)
+    filename = os.path.join(output_dir, 'profiles.csv')
+    ids = IterIDs(tenant['url'], session, "configurationprofiles", tenant['page_size'])
+    rows = jamf_export_config_profiles.FetchConfInfo(tenant['url'], session, ids, tenant['workers'], subsets=SubsetsForColumns(jamf_export_config_profiles.COLUMN_SUBSETS, columns))
+    scope_index = ScopeIndex()
+    rows = scope_index.Track('profiles', rows)
+    result = {'rows': WriteToCSV(rows, columns, filename), 'file': filename}
+    scope_index.Write(os.path.join(output_dir, 'scope_index.json'))
+    return result
+
+
+# Function: ClearFailures(tenant, session, output_dir)
+# Runs jhs_clear_failures.py for the tenant's flush_group.
+# Raises an error when flush_mode is 'group' and the server can't flush by group, so nothing was flushed.
+# Returns result dictionary
+
+def ClearFailures(tenant, session, output_dir):
+    if not tenant.get('flush_group'):
+        return {'skipped': 'no flush_group configured'}
+    result = jhs_clear_failures.ClearFailures(tenant['url'], session, tenant['flush_group'], tenant['flush_status'], tenant['flush_mode'], tenant['workers'])
+    if result['mode'] == 'group' and result['failed'] is None:
+        raise RuntimeError("server does not support flushing commands by group (flush_mode 'group')")
+    return result
+
+
+OPERATION_FUNCTIONS = {'export-apps': ExportApps, 'export-profiles': ExportProfiles, 'clear-failures': ClearFailures}
+
+
+# Function: RunTenant(tenant, operations, output_dir)
+# Child process: runs the operations for one tenant in order with one session, logging to <output_dir>/log.txt.
+# A failing operation is recorded and the tenant moves on to the next one.
+# Returns array of result dictionaries
+
+def RunTenant(tenant, operations, output_dir):
+    os.makedirs(output_dir, exist_ok=True)
+    results = []
+    with open(os.path.join(output_dir, 'log.txt'), 'w') as log, contextlib.redirect_stdout(log):
+        limiter = AdaptiveRateLimiter(tenant['start_rate'], tenant['max_rate'])
+        session = CreateSession(tenant['url'], tenant['user'], tenant['password'], tenant['workers'], limiter=limiter)
+        for operation in operations:
+            start = time.monotonic()
+            result = {'tenant': tenant['name'], 'operation': operation}
+            try:
+                result.update(OPERATION_FUNCTIONS[operation](tenant, session, output_dir))
+                result['status'] = 'ok'
+            except Exception as error:
+                traceback.print_exc(file=log)
+                result.update({'status': 'error', 'error': str(error)})
+            result['seconds'] = round(time.monotonic() - start, 1)
+            results.append(result)
+            print(json.dumps(result))
+    return results
+
+
+# Function: PrintSummary(results)
+# Prints one line per tenant and operation.
+# Void Return
+
+def PrintSummary(results):
+    print("{:<20} {:<16} {:<7} {:>9}  {}".format('tenant', 'operation', 'status', 'seconds', 'details'))
+    for result in results:
+        details = {key: value for key, value in result.items() if key not in ('tenant', 'operation', 'status', 'seconds')}
+        print("{:<20} {:<16} {:<7} {:>9}  {}".format(result['tenant'], result['operation'], result['status'], result['seconds'], json.dumps(details)))
+
+
+# Main Function
+
+def main():
+    args = ParseArguments()
+    tenants = LoadTenants(args.config, args.tenants.split(',') if args.tenants else None)
+    operations = args.operations.split(',')
+    os.makedirs(args.output_dir, exist_ok=True)
+    start = time.monotonic()
+    results = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.processes or len(tenants) or 1) as pool:
+        futures = {pool.submit(RunTenant, tenant, operations, os.path.join(args.output_dir, tenant['name'])): tenant for tenant in tenants}
+        for future in concurrent.futures.as_completed(futures):
+            tenant = futures[future]
+            try:
+                tenant_results = future.result()
+            except Exception as error:
+                tenant_results = [{'tenant': tenant['name'], 'operation': operation, 'status': 'error', 'error': str(error), 'seconds': 0} for operation in operations]
+            print("Finished {} after {:.1f}s".format(tenant['name'], time.monotonic() - start), file=sys.stderr)
+            results.extend(tenant_results)
+    results.sort(key=lambda result: (result['tenant'], operations.index(result['operation'])))
+    PrintSummary(results)
+    with open(os.path.join(args.output_dir, 'summary.json'), 'w') as file:
+        json.dump({'seconds': round(time.monotonic() - start, 1), 'results': results}, file, indent=2)
+    if any(result['status'] != 'ok' for result in results):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+# Copyright (c) 2021 jsd-git
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Streams object ids page by page from the Jamf Pro API instead of pulling the whole Classic API
+# listing in one response. The next page is fetched in the background while the current one is
+# handed out, so detail fetching can start as soon as the first page arrives and only two pages of
+# ids are ever held in memory. Paging is opt-in (--page-size 200): the Jamf Pro API paths below have
+# only been checked against jamf_mock_server.py. Servers without a paged list for an object type (404),
+# or accounts not allowed to use it (401 / 403 - the Jamf Pro API has its own privileges, and servers
+# on the basic auth fallback can't use it at all), fall back to the Classic listing.
+
+import concurrent.futures
+from jamf_decode import DecodeResponse
+from jamf_metrics import Stage
+
+# ----------------------------------------------------------------------------------
+
+DEFAULT_PAGE_SIZE = 0 # 0 uses the Classic API listing
+
+# Status codes that mean the paged list can't be used and the Classic listing should be used instead
+PAGED_UNAVAILABLE_STATUS = (401, 403, 404)
+
+# Classic API endpoint -> (Jamf Pro API paged list, key of the list in the Classic response)
+PAGED_LISTS = {
+    'mobiledeviceapplications': ('/api/v1/mobile-device-apps', 'mobile_device_applications'),
+    'configurationprofiles': ('/api/v1/mobile-device-configuration-profiles', 'configuration_profiles'),
+}
+
+
+# Class: PagedListUnavailable
+# Raised when the server has no Jamf Pro API paged list for an object type, or won't let us use it.
+
+class PagedListUnavailable(Exception):
+    pass
+
+
+# Function: FetchPage(jss_url, session, path, page, page_size)
+# Queries one page of a Jamf Pro API list, sorted by id so pages do not overlap.
+# Returns (results array, totalCount)
+
+def FetchPage(jss_url, session, path, page, page_size):
+    jss_response = session.get(jss_url + path, params={'page': page, 'page-size': page_size, 'sort': 'id:asc'})
+    if jss_response.status_code in PAGED_UNAVAILABLE_STATUS:
+        raise PagedListUnavailable("{} answered {}".format(path, jss_response.status_code))
+    jss_response.raise_for_status()
+    with Stage('decode'):
+        jss_json = DecodeResponse(jss_response)
+    return jss_json['results'], jss_json['totalCount']
+
+
+# Function: IterPagedIDs(jss_url, session, path, page_size)
+# Yields the id of every object in a Jamf Pro API list, prefetching the next page while the current one is consumed.
+# Yields ids
+
+def IterPagedIDs(jss_url, session, path, page_size=200):
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as prefetcher:
+        page = 0
+        future = prefetcher.submit(FetchPage, jss_url, session, path, page, page_size)
+        while future is not None:
+            with Stage('list_ids'):
+                results, total = future.result()
+            page += 1
+            future = None
+            if results and page * page_size < total:
+                future = prefetcher.submit(FetchPage, jss_url, session, path, page, page_size)
+            for entry in results:
+                yield int(entry['id']) if str(entry['id']).isdigit() else entry['id']
+
+
+# Function: IterClassicIDs(jss_url, session, endpoint, key)
+# Yields the id of every object in a Classic API listing (the whole list arrives in one response).
+# Yields ids
+
+def IterClassicIDs(jss_url, session, endpoint, key):
+    with Stage('list_ids'):
+        jss_response = session.get(jss_url + "/JSSResource/" + endpoint)
+        jss_response.raise_for_status()
+        full_list = DecodeResponse(jss_response)[key]
+    for entry in full_list:
+        yield entry['id']
+
+
+# Function: IterIDs(jss_url, session, endpoint, page_size)
+# Yields the id of every object of a Classic API endpoint type, e.g. "mobiledeviceapplications", paging
+# through the Jamf Pro API when the server supports it and falling back to the Classic listing otherwise.
+# page_size of 0 goes straight to the Classic listing. A fallback is reported on stdout, so a wrong
+# paged list path shows up instead of quietly costing the paging.
+# Yields ids
+
+def IterIDs(jss_url, session, endpoint, page_size=DEFAULT_PAGE_SIZE):
+    path, key = PAGED_LISTS[endpoint]
+    if page_size:
+        started = False
+        try:
+            for object_id in IterPagedIDs(jss_url, session, path, page_size):
+                started = True
+                yield object_id
+            return
+        except PagedListUnavailable as error:
+            if started:
+                raise
+            print("Paged id listing unavailable ({}), falling back to the Classic API listing.".format(error))
+    yield from IterClassicIDs(jss_url, session, endpoint, key)
+
+
+# Function: AddPagingArguments(parser)
+# Adds the --page-size flag to a script's argument parser.
+# Void Return
+
+def AddPagingArguments(parser):
+    parser.add_argument('--page-size', dest='page_size', type=int, default=DEFAULT_PAGE_SIZE, help='Stream ids from the Jamf Pro API this many per page, e.g. 200. Only checked against jamf_mock_server.py so far; falls back to the Classic listing if the server refuses. (Default: 0, the single Classic API listing)')
@@ -0,0 +1,222 @@
+# Copyright (c) 2021 jsd-git
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Optional per-request and per-stage instrumentation for the JAMF scripts, switched on with --profile.
+# Records time per endpoint and per pipeline stage, connection setup (DNS/TCP/TLS) time, status codes,
+# retries and bytes transferred, and writes a JSON summary plus an optional Chrome trace file
+# (open it in chrome://tracing or ui.perfetto.dev).
+# When profiling is off Stage() hands back a shared no-op context manager and no hooks are installed.
+
+import atexit
+import contextlib
+import json
+import re
+import threading
+import time
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# ----------------------------------------------------------------------------------
+
+NULL_STAGE = contextlib.nullcontext()
+ACTIVE = None # The Metrics of this run, or None when profiling is off
+
+
+# Class: Metrics(trace)
+# Collects timings for one run. Safe to share between threads.
+
+class Metrics:
+    def __init__(self, trace=False):
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+        self.endpoints = {}
+        self.stages = {}
+        self.status_codes = {}
+        self.retries = 0
+        self.bytes = 0
+        self.counters = {}
+        self.events = [] if trace else None
+
+    # Function: Record(table, name, seconds, started)
+    # Adds one timing to the endpoint or stage table, and to the trace when tracing.
+    # Returns the table entry
+
+    def Record(self, table, name, seconds, started, category):
+        with self.lock:
+            entry = table.setdefault(name, {'count': 0, 'total_s': 0.0, 'max_s': 0.0})
+            entry['count'] += 1
+            entry['total_s'] += seconds
+            entry['max_s'] = max(entry['max_s'], seconds)
+            if self.events is not None:
+                self.events.append({'name': name, 'cat': category, 'ph': 'X', 'pid': 1, 'tid': threading.get_ident(),
+                                    'ts': round((started - self.start) * 1e6), 'dur': round(seconds * 1e6)})
+            return entry
+
+    # Function: RecordResponse(response)
+    # requests response hook: records endpoint time, status code, retries and bytes of a response.
+    # Returns response
+
+    def RecordResponse(self, response, *args, **kwargs):
+        seconds = ResponseSeconds(response)
+        size = len(response.content)
+        retries = getattr(getattr(response.raw, 'retries', None), 'history', ())
+        entry = self.Record(self.endpoints, EndpointName(response.request.method, response.url), seconds, time.perf_counter() - seconds, 'http')
+        with self.lock:
+            entry['bytes'] = entry.get('bytes', 0) + size
+            code = str(response.status_code)
+            self.status_codes[code] = self.status_codes.get(code, 0) + 1
+            self.retries += len(retries)
+            self.bytes += size
+        return response
+
+    # Function: Count(name)
+    # Adds one to a named counter, e.g. Count('throttled')
+    # Void Return
+
+    def Count(self, name):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    # Function: Summary()
+    # Returns the JSON summary of the run
+
+    def Summary(self):
+        with self.lock:
+            requests = sum(entry['count'] for entry in self.endpoints.values())
+            return {'wall_s': round(time.perf_counter() - self.start, 3), 'requests': requests, 'bytes': self.bytes,
+                    'retries': self.retries, 'status_codes': dict(self.status_codes), 'counters': dict(self.counters),
+                    'endpoints': RoundTable(self.endpoints), 'stages': RoundTable(self.stages)}
+
+
+# Class: StageTimer(name)
+# Context manager that records how long its block took as a pipeline stage.
+
+class StageTimer:
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.metrics.Record(self.metrics.stages, self.name, time.perf_counter() - self.started, self.started, 'stage')
+        return False
+
+
+# Function: Stage(name)
+# Times a block of a pipeline stage, e.g. with Stage('decode'): ...
+# Returns a context manager (a shared no-op one when profiling is off)
+
+def Stage(name):
+    if ACTIVE is None:
+        return NULL_STAGE
+    return StageTimer(ACTIVE, name)
+
+
+# Function: ResponseSeconds(response)
+# Time the server took to answer, without the client side rate limit waits and throttle retries that
+# response.elapsed includes (see RateLimitedAdapter).
+# Returns seconds
+
+def ResponseSeconds(response):
+    seconds = getattr(response, 'attempt_elapsed', None)
+    return response.elapsed.total_seconds() if seconds is None else seconds
+
+
+# Function: EndpointName(method, url)
+# Groups urls by endpoint by replacing ids, e.g. "GET /JSSResource/mobiledeviceapplications/id/{id}"
+# Returns string
+
+def EndpointName(method, url):
+    path = re.sub(r'^https?://[^/]+', '', url).split('?')[0]
+    return "{} {}".format(method, re.sub(r'/\d+(?=/|$)', '/{id}', path))
+
+
+# Function: RoundTable(table)
+# Returns a copy of an endpoint or stage table with averages added and times rounded
+
+def RoundTable(table):
+    rounded = {}
+    for name, entry in table.items():
+        rounded[name] = dict(entry, total_s=round(entry['total_s'], 4), max_s=round(entry['max_s'], 4),
+                             avg_ms=round(entry['total_s'] / entry['count'] * 1000, 2))
+    return rounded
+
+
+# Class: TimedHTTPConnection / TimedHTTPSConnection
+# urllib3 connections that record the time spent opening them (DNS, TCP and TLS) as the "connect" stage.
+
+class TimedHTTPConnection(HTTPConnection):
+    def connect(self):
+        with Stage('connect'):
+            return super().connect()
+
+class TimedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        with Stage('connect'):
+            return super().connect()
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+# Function: AddProfileArguments(parser)
+# Adds the --profile and --trace flags to a script's argument parser.
+# Void Return
+
+def AddProfileArguments(parser):
+    parser.add_argument('--profile', dest='profile', type=str, help='Write a JSON summary of request and stage timings, status codes, retries and bytes to this file.')
+    parser.add_argument('--trace', dest='trace', type=str, help='With --profile, also write a Chrome trace of every request and stage to this file.')
+
+
+# Function: EnableProfiling(session, args)
+# Switches instrumentation on for this run if --profile was given: hooks the session and
+# writes the summary (and trace) when the script exits, even if it crashes.
+# Returns Metrics, or None when profiling is off
+
+def EnableProfiling(session, args):
+    global ACTIVE
+    if not args.profile:
+        return None
+    ACTIVE = Metrics(trace=bool(args.trace))
+    session.hooks['response'].append(ACTIVE.RecordResponse)
+    for adapter in session.adapters.values():
+        adapter.poolmanager.pool_classes_by_scheme = {'http': TimedHTTPConnectionPool, 'https': TimedHTTPSConnectionPool}
+    atexit.register(WriteProfile, ACTIVE, args.profile, args.trace)
+    return ACTIVE
+
+
+# Function: WriteProfile(metrics, profile_file, trace_file)
+# Writes the JSON summary and, if asked for, the trace file.
+# Void Return
+
+def WriteProfile(metrics, profile_file, trace_file=None):
+    try:
+        with open(profile_file, 'w') as file:
+            json.dump(metrics.Summary(), file, indent=2)
+        if trace_file and metrics.events is not None:
+            with open(trace_file, 'w') as file:
+                json.dump({'traceEvents': metrics.events}, file)
+    except IOError:
+        print("I/O Error")
@@ -0,0 +1,306 @@
+# Copyright (c) 2021 jsd-git
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Local SQLite mirror of mobile device applications, configuration profiles and mobile device groups,
+# so inventory questions are answered from an indexed database instead of a full API crawl.
+# Example usage:
+#   jamf_mirror.py --db jamf.db sync --url https://sub.jamfcloud.com --user testinguser --pass supersecret --workers 8
+#   jamf_mirror.py --db jamf.db sync --incremental --url https://sub.jamfcloud.com --user testinguser --pass supersecret
+#   jamf_mirror.py --db jamf.db query apps-for-group 12
+#   jamf_mirror.py --db jamf.db query vpp-exhausted
+#   jamf_mirror.py --db jamf.db query sql "SELECT name, version FROM apps WHERE bundle_id LIKE 'com.apple.%'"
+
+import argparse
+import csv
+import math
+import sqlite3
+import sys
+import time
+import jamf_export_apps
+import jamf_export_config_profiles
+from jamf_cache import AddCacheArguments, CacheFromArgs
+from jamf_client import CreateSession
+from jamf_csv import SubsetsForColumns
+from jamf_decode import DecodeResponse
+from jamf_metrics import AddProfileArguments, EnableProfiling, Stage
+from jamf_ratelimit import AddRateLimitArguments, RateLimiterFromArgs
+
+# ----------------------------------------------------------------------------------
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS apps (
+    id INTEGER PRIMARY KEY, name TEXT, display_name TEXT, bundle_id TEXT, version TEXT,
+    scope_all INTEGER, scope_all_users INTEGER, vpp_on INTEGER,
+    vpp_licenses INTEGER, vpp_licenses_used INTEGER, vpp_licenses_remaining INTEGER, synced_at REAL);
+CREATE TABLE IF NOT EXISTS profiles (
+    id INTEGER PRIMARY KEY, name TEXT, scope_all INTEGER, scope_all_users INTEGER, synced_at REAL);
+CREATE TABLE IF NOT EXISTS groups (
+    id INTEGER PRIMARY KEY, name TEXT, is_smart INTEGER, synced_at REAL);
+CREATE TABLE IF NOT EXISTS app_scope (
+    app_id INTEGER, group_id INTEGER, PRIMARY KEY (app_id, group_id));
+CREATE TABLE IF NOT EXISTS profile_scope (
+    profile_id INTEGER, group_id INTEGER, PRIMARY KEY (profile_id, group_id));
+CREATE INDEX IF NOT EXISTS app_scope_group ON app_scope (group_id);
+CREATE INDEX IF NOT EXISTS profile_scope_group ON profile_scope (group_id);
+CREATE INDEX IF NOT EXISTS apps_bundle_id ON apps (bundle_id);
+CREATE INDEX IF NOT EXISTS apps_vpp_remaining ON apps (vpp_on, vpp_licenses_remaining);
+"""
+
+# Canned reports for the query subcommand: name -> (SQL, number of parameters, description)
+REPORTS = {
+    'apps-for-group': ("""SELECT a.id, a.name, a.bundle_id, a.version FROM app_scope s JOIN apps a ON a.id = s.app_id
+                          WHERE s.group_id = ? ORDER BY a.name""", 1, 'Apps scoped to group GROUP_ID'),
+    'profiles-for-group': ("""SELECT p.id, p.name FROM profile_scope s JOIN profiles p ON p.id = s.profile_id
+                              WHERE s.group_id = ? ORDER BY p.name""", 1, 'Configuration profiles scoped to group GROUP_ID'),
+    'scoped-to-all': ("""SELECT 'app' AS kind, id, name, scope_all, scope_all_users FROM apps WHERE scope_all OR scope_all_users
+                         UNION ALL
+                         SELECT 'profile', id, name, scope_all, scope_all_users FROM profiles WHERE scope_all OR scope_all_users""", 0, 'Apps and profiles scoped to all devices or all users'),
+    'vpp-exhausted': ("""SELECT id, name, vpp_licenses, vpp_licenses_used FROM apps
+                         WHERE vpp_on = 1 AND vpp_licenses_remaining <= 0 ORDER BY name""", 0, 'VPP apps with no licenses left'),
+    'unscoped-apps': ("""SELECT a.id, a.name FROM apps a WHERE NOT a.scope_all AND NOT a.scope_all_users
+                         AND NOT EXISTS (SELECT 1 FROM app_scope s WHERE s.app_id = a.id) ORDER BY a.name""", 0, 'Apps not scoped to anything'),
+    'apps': ("""SELECT a.*, (SELECT group_concat(group_id) FROM app_scope s WHERE s.app_id = a.id) AS scope_group_ids
+                FROM apps a ORDER BY a.id""", 0, 'Every app, like jamf_export_apps.py'),
+    'profiles': ("""SELECT p.*, (SELECT group_concat(group_id) FROM profile_scope s WHERE s.profile_id = p.id) AS scope_group_ids
+                    FROM profiles p ORDER BY p.id""", 0, 'Every configuration profile, like jamf_export_config_profiles.py'),
+    'group-names': ("""SELECT id, name, is_smart FROM groups ORDER BY name""", 0, 'Every mobile device group'),
+    'sql': (None, 1, 'Run your own read-only SQL'),
+}
+
+
+# Function: ParseArguments()
+# Parses command line flags
+# Returns args object
+
+def ParseArguments():
+    parser = argparse.ArgumentParser(description="Mirrors JAMF apps, configuration profiles and groups into a local SQLite database and runs reports against it.")
+    parser.add_argument('--db', dest='db', type=str, default='jamf_mirror.db', help='The SQLite database file. (Default: jamf_mirror.db)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    sync = subparsers.add_parser('sync', help='Refresh the mirror from the JAMF API.')
+    sync.add_argument('--url', dest='jssurl', type=str, help='Your JAMF URL. (Must include https://) Example: https://sub.jamfcloud.com', required=True)
+    sync.add_argument('--user', dest='username', type=str, help='Your JAMF username.', required=True)
+    sync.add_argument('--pass',dest='password', type=str, help='Your JAMF password.', required=True)
+    sync.add_argument('--workers', dest='workers', type=int, default=1, help='Number of objects to fetch at the same time. (Default: 1)')
+    sync.add_argument('--incremental', dest='incremental', action='store_true', help='Only fetch details of objects that are new, changed (by name/version in the list endpoint) or due for revalidation.')
+    sync.add_argument('--revalidate', dest='revalidate', type=float, default=0.05, help='With --incremental, fraction of unchanged objects to refetch each run, oldest first. (Default: 0.05)')
+    AddCacheArguments(sync)
+    AddRateLimitArguments(sync)
+    AddProfileArguments(sync)
+
+    query = subparsers.add_parser('query', help='Run a report against the mirror and print it as CSV.')
+    query.add_argument('report', type=str, choices=sorted(REPORTS), help='; '.join("{}: {}".format(name, REPORTS[name][2]) for name in sorted(REPORTS)))
+    query.add_argument('params', type=str, nargs='*', help='Report parameters, e.g. the group id, or the SQL for "sql".')
+    args = parser.parse_args()
+    return args
+
+
+# Function: OpenDatabase(filename)
+# Opens the mirror database, creating the tables and indexes if needed.
+# Returns sqlite3 Connection
+
+def OpenDatabase(filename):
+    db = sqlite3.connect(filename)
+    db.executescript(SCHEMA)
+    return db
+
+
+# Function: FetchGroups(jss_url, session)
+# Queries JAMF API for all Mobile Device Groups.
+# Returns array of {id, name, is_smart} dictionaries
+
+def FetchGroups(jss_url, session):
+    jss = jss_url + "/JSSResource/mobiledevicegroups"
+    jss_response = session.get(jss)
+    jss_response.raise_for_status()
+    jss_json = DecodeResponse(jss_response)
+    return jss_json["mobile_device_groups"]
+
+
+# Function: StoreApp(db, device_profile, synced_at)
+# Writes one app row from jamf_export_apps.FetchAppInfo, and its group scope, to the mirror.
+# Void Return
+
+def StoreApp(db, device_profile, synced_at):
+    db.execute("INSERT OR REPLACE INTO apps VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (
+        device_profile['id'], device_profile.get('name'), device_profile.get('display_name'), device_profile.get('bundle_id'),
+        device_profile.get('version'), device_profile.get('scope_all'), device_profile.get('scope_all_users'),
+        device_profile.get('vpp_on'), device_profile.get('vpp_licenses'), device_profile.get('vpp_licenses_used'),
+        device_profile.get('vpp_licenses_remaining'), synced_at))
+    db.execute("DELETE FROM app_scope WHERE app_id = ?", (device_profile['id'],))
+    db.executemany("INSERT OR IGNORE INTO app_scope VALUES (?, ?)", [(device_profile['id'], group['id']) for group in device_profile.get('scope') or []])
+
+
+# Function: StoreProfile(db, device_profile, synced_at)
+# Writes one profile row from jamf_export_config_profiles.FetchConfInfo, and its group scope, to the mirror.
+# Void Return
+
+def StoreProfile(db, device_profile, synced_at):
+    db.execute("INSERT OR REPLACE INTO profiles VALUES (?, ?, ?, ?, ?)", (
+        device_profile['id'], device_profile.get('name'), device_profile.get('scope_all'), device_profile.get('scope_all_users'), synced_at))
+    db.execute("DELETE FROM profile_scope WHERE profile_id = ?", (device_profile['id'],))
+    db.executemany("INSERT OR IGNORE INTO profile_scope VALUES (?, ?)", [(device_profile['id'], group['id']) for group in device_profile.get('scope') or []])
+
+
+# Function: StoreGroups(db, groups, synced_at)
+# Replaces the mirrored group list.
+# Void Return
+
+def StoreGroups(db, groups, synced_at):
+    db.execute("DELETE FROM groups")
+    db.executemany("INSERT INTO groups VALUES (?, ?, ?, ?)", [(group['id'], group['name'], group.get('is_smart'), synced_at) for group in groups])
+
+
+# Function: RemoveMissing(db, table, scope_table, scope_column, ids)
+# Drops mirrored objects that no longer exist in JAMF.
+# Returns number of rows removed
+
+def RemoveMissing(db, table, scope_table, scope_column, ids):
+    db.execute("CREATE TEMP TABLE IF NOT EXISTS current_ids (id INTEGER PRIMARY KEY)")
+    db.execute("DELETE FROM current_ids")
+    db.executemany("INSERT OR IGNORE INTO current_ids VALUES (?)", [(x,) for x in ids])
+    db.execute("DELETE FROM {} WHERE {} NOT IN (SELECT id FROM current_ids)".format(scope_table, scope_column))
+    return db.execute("DELETE FROM {} WHERE id NOT IN (SELECT id FROM current_ids)".format(table)).rowcount
+
+
+# Function: StoreAll(db, rows, store, batch_size)
+# Streams fetched rows into the mirror, committing every batch_size rows.
+# Returns number of rows stored
+
+def StoreAll(db, rows, store, synced_at, batch_size=500):
+    count = 0
+    for device_profile in rows:
+        with Stage('store'):
+            store(db, device_profile, synced_at)
+        count += 1
+        if count % batch_size == 0:
+            db.commit()
+    db.commit()
+    return count
+
+
+# Function: PlanSync(db, table, listing, fields, incremental, revalidate)
+# Decides which listed objects need their details fetched. A full sync fetches everything. An incremental
+# sync compares the list endpoint against the mirror and only fetches objects that are new, whose cheap
+# list fields (e.g. name, version) changed, or that are due for revalidation: the `revalidate` fraction
+# of the remaining objects with the oldest sync time, so every object is refetched every 1/revalidate runs.
+# Changed and revalidated objects are already known to the mirror (and maybe the response cache) in an
+# older state, so they have to come from the server rather than the cache.
+# Returns (ids that may be served from the cache, ids to fetch fresh, counts dictionary)
+
+def PlanSync(db, table, listing, fields, incremental, revalidate):
+    if not incremental:
+        return [entry['id'] for entry in listing], [], {'fetched': len(listing)}
+    stored = {}
+    for row in db.execute("SELECT id, synced_at, {} FROM {}".format(", ".join(fields), table)):
+        stored[row[0]] = (row[1], dict(zip(fields, row[2:])))
+    new = []
+    changed = []
+    unchanged = []
+    for entry in listing:
+        if entry['id'] not in stored:
+            new.append(entry['id'])
+            continue
+        synced_at, values = stored[entry['id']]
+        if any(field in entry and str(entry[field]) != str(values[field]) for field in fields):
+            changed.append(entry['id'])
+        else:
+            unchanged.append((synced_at, entry['id']))
+    unchanged.sort()
+    due = [object_id for synced_at, object_id in unchanged[:math.ceil(len(unchanged) * revalidate)]]
+    counts = {'new': len(new), 'changed': len(changed), 'revalidated': len(due), 'unchanged': len(unchanged) - len(due)}
+    return new, changed + due, counts
+
+
+# Function: SyncObjects(db, jss_url, session, args, kind, listing, synced_at, cache)
+# Fetches the planned apps or profiles, stores them and drops the ones JAMF no longer lists.
+# Void Return
+
+def SyncObjects(db, jss_url, session, args, kind, listing, synced_at, cache):
+    if kind == 'apps':
+        module, table, scope_table, scope_column, fields, store = jamf_export_apps, 'apps', 'app_scope', 'app_id', ('name', 'version'), StoreApp
+        fetch = jamf_export_apps.FetchAppInfo
+    else:
+        module, table, scope_table, scope_column, fields, store = jamf_export_config_profiles, 'profiles', 'profile_scope', 'profile_id', ('name',), StoreProfile
+        fetch = jamf_export_config_profiles.FetchConfInfo
+    cached_ids, fresh_ids, counts = PlanSync(db, table, listing, fields, args.incremental, args.revalidate)
+    subsets = SubsetsForColumns(module.COLUMN_SUBSETS, module.COLUMN_SUBSETS)
+    StoreAll(db, fetch(jss_url, session, cached_ids, args.workers, cache, args.refresh, subsets), store, synced_at)
+    StoreAll(db, fetch(jss_url, session, fresh_ids, args.workers, cache, True, subsets), store, synced_at)
+    counts['removed'] = RemoveMissing(db, table, scope_table, scope_column, [entry['id'] for entry in listing])
+    db.commit()
+    print("Mirrored {}: {}".format(kind, ", ".join("{} {}".format(value, name) for name, value in counts.items())))
+
+
+# Function: Sync(db, jss_url, session, args)
+# Refreshes groups, apps and profiles in the mirror from the API.
+# Void Return
+
+def Sync(db, jss_url, session, args):
+    synced_at = time.time()
+    cache = CacheFromArgs(args)
+    with Stage('list_ids'):
+        groups = FetchGroups(jss_url, session)
+    StoreGroups(db, groups, synced_at)
+    db.commit()
+    print("Mirrored {} groups.".format(len(groups)))
+    with Stage('list_ids'):
+        app_list = jamf_export_apps.FetchList(jss_url, session)
+    SyncObjects(db, jss_url, session, args, 'apps', app_list, synced_at, cache)
+    with Stage('list_ids'):
+        conf_list = jamf_export_config_profiles.FetchList(jss_url, session)
+    SyncObjects(db, jss_url, session, args, 'profiles', conf_list, synced_at, cache)
+
+
+# Function: Query(db, report, params)
+# Runs a canned report (or raw read-only SQL) and writes the result to stdout as CSV.
+# Void Return
+
+def Query(db, report, params):
+    sql, param_count, description = REPORTS[report]
+    if len(params) != param_count:
+        sys.exit("{} takes {} parameter(s), got {}".format(report, param_count, len(params)))
+    if sql is None:
+        db.execute("PRAGMA query_only = ON")
+        sql, params = params[0], []
+    try:
+        cursor = db.execute(sql, params)
+    except sqlite3.Error as error:
+        sys.exit("Query failed: {}".format(error))
+    writer = csv.writer(sys.stdout)
+    writer.writerow([column[0] for column in cursor.description])
+    writer.writerows(cursor)
+
+
+# Main Function
+
+def main():
+    args = ParseArguments()
+    db = OpenDatabase(args.db)
+    if args.command == 'sync':
+        session = CreateSession(args.jssurl, args.username, args.password, args.workers, limiter=RateLimiterFromArgs(args))
+        EnableProfiling(session, args)
+        Sync(db, args.jssurl, session, args)
+    else:
+        Query(db, args.report, args.params)
+    db.close()
+
+if __name__ == "__main__":
+    main()
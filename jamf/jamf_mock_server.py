@@ -0,0 +1,378 @@
+# Copyright (c) 2021 jsd-git
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Local stand-in for a JAMF server, used by jamf_bench.py and for trying the scripts without
+# touching a real tenant. Serves the Classic API endpoints (and Jamf Pro API
+# paged lists) the scripts use from generated data.
+# Example usage: jamf_mock_server.py --port 8080 --apps 1000 --profiles 500 --latency 0.02 --error-rate 0.01
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ----------------------------------------------------------------------------------
+
+# Class: MockConfig
+# Settings for the generated tenant and how the server behaves.
+
+class MockConfig:
+    def __init__(self, apps=100, profiles=100, groups=10, devices=100, latency=0.0, jitter=0.0,
+                 payload_size=1024, throttle_rate=0.0, error_rate=0.0, retry_after=1, group_flush=True, seed=1,
+                 failure_rate=0.0, new_failures=0.0):
+        self.apps = apps                    # Number of mobile device applications
+        self.profiles = profiles            # Number of configuration profiles
+        self.groups = groups                # Number of mobile device groups
+        self.devices = devices              # Number of devices in every group
+        self.latency = latency              # Seconds added to every response
+        self.jitter = jitter                # Up to this many extra seconds, picked at random
+        self.payload_size = payload_size    # Bytes of filler in each app / profile document
+        self.throttle_rate = throttle_rate  # Fraction of requests answered 429
+        self.error_rate = error_rate        # Fraction of requests answered 500/502/503
+        self.retry_after = retry_after      # Retry-After seconds sent with 429s
+        self.group_flush = group_flush      # Whether /commandflush/mobiledevicegroups is supported
+        self.seed = seed
+        self.failure_rate = failure_rate    # Fraction of devices that start with failed commands
+        self.new_failures = new_failures    # Devices that get a newly failed command per minute
+
+
+# Class: MockJamf(config)
+# Generated tenant data plus request counters. Deleting an app removes it for the rest of the run.
+
+class MockJamf:
+    def __init__(self, config):
+        self.config = config
+        self.lock = threading.Lock()
+        self.random = random.Random(config.seed)
+        self.apps = set(range(1, config.apps + 1))
+        self.profiles = set(range(1, config.profiles + 1))
+        self.requests = 0
+        self.injected = 0
+        self.flushes = 0
+        devices = range(1, max(config.groups, 1) * config.devices + 1)
+        self.failed = {x: 1 + x % 3 for x in devices if self.random.random() < config.failure_rate} # device id -> failed commands
+        self.failures_at = time.monotonic()
+
+    def App(self, app_id):
+        groups = self.config.groups or 1
+        vpp = app_id % 2 == 0
+        return {'mobile_device_application': {
+            'general': {'id': app_id, 'name': "App {}".format(app_id), 'display_name': "App {}".format(app_id),
+                        'bundle_id': "com.example.app{}".format(app_id), 'version': "1.{}".format(app_id % 10),
+                        'description': Filler(self.config.payload_size)},
+            'scope': {'all_mobile_devices': app_id % 25 == 0, 'all_jss_users': app_id % 50 == 0,
+                      'mobile_device_groups': [{'id': app_id % groups + 1, 'name': "Group {}".format(app_id % groups + 1)}]},
+            'self_service': {'self_service_description': Filler(self.config.payload_size // 2)},
+            'vpp': {'assign_vpp_device_based_licenses': vpp, 'total_vpp_licenses': 10 if vpp else 0,
+                    'used_vpp_licenses': app_id % 11 if vpp else 0, 'remaining_vpp_licenses': 10 - app_id % 11 if vpp else 0},
+            'app_configuration': {'preferences': Filler(self.config.payload_size // 2)},
+        }}
+
+    def Profile(self, profile_id):
+        groups = self.config.groups or 1
+        return {'configuration_profile': {
+            'general': {'id': profile_id, 'name': "Profile {}".format(profile_id), 'payloads': Filler(self.config.payload_size)},
+            'scope': {'all_mobile_devices': profile_id % 20 == 0, 'all_jss_users': False,
+                      'mobile_device_groups': [{'id': profile_id % groups + 1, 'name': "Group {}".format(profile_id % groups + 1)}]},
+            'self_service': {'self_service_description': Filler(self.config.payload_size // 2)},
+        }}
+
+    def Group(self, group_id):
+        first = (group_id - 1) * self.config.devices + 1
+        return {'mobile_device_group': {'id': group_id, 'name': "Group {}".format(group_id), 'is_smart': True,
+                'mobile_devices': [{'id': x, 'name': "Device {}".format(x)} for x in range(first, first + self.config.devices)]}}
+
+    # Function: History(device_id)
+    # Builds the mobiledevicehistory document of a device, first adding any failures due since the last call.
+    # Returns document
+
+    def History(self, device_id):
+        with self.lock:
+            self.AddFailures()
+            failed = self.failed.get(device_id, 0)
+        return {'mobile_device_history': {
+            'general': {'id': device_id, 'name': "Device {}".format(device_id)},
+            'management_commands': {
+                'completed': [{'name': 'DeviceInformation', 'completed': '2021-01-01 00:00:00'}],
+                'pending': [],
+                'failed': [{'name': 'InstallApplication', 'status': 'Failed', 'error': 'The app could not be installed.'} for x in range(failed)]},
+        }}
+
+    # Function: AddFailures()
+    # Gives random devices a failed command at config.new_failures per minute. Call with the lock held.
+    # Void Return
+
+    def AddFailures(self):
+        if not self.config.new_failures:
+            return
+        due = int((time.monotonic() - self.failures_at) * self.config.new_failures / 60)
+        if due:
+            self.failures_at += due * 60 / self.config.new_failures
+            devices = max(self.config.groups, 1) * self.config.devices
+            for x in range(due):
+                device_id = self.random.randint(1, devices)
+                self.failed[device_id] = self.failed.get(device_id, 0) + 1
+
+    # Function: Flush(device_ids, status)
+    # Clears the failed commands of devices when status includes Failed.
+    # Void Return
+
+    def Flush(self, device_ids, status):
+        with self.lock:
+            self.flushes += 1
+            if 'Failed' in status:
+                for device_id in device_ids:
+                    self.failed.pop(device_id, None)
+
+    # Function: Inject()
+    # Decides whether this request gets an injected 429 or 5xx.
+    # Returns status code to fail with, or None
+
+    def Inject(self):
+        with self.lock:
+            self.requests += 1
+            roll = self.random.random()
+            if roll < self.config.throttle_rate:
+                self.injected += 1
+                return 429
+            if roll < self.config.throttle_rate + self.config.error_rate:
+                self.injected += 1
+                return self.random.choice((500, 502, 503))
+        return None
+
+
+# Function: Filler(size)
+# Returns a string of `size` characters to pad documents out to realistic sizes
+
+def Filler(size):
+    return "x" * max(size, 0)
+
+
+# Function: Subset(document, subsets)
+# Cuts a document down to the requested Classic API subsets, e.g. "General&Scope".
+# Returns document
+
+def Subset(document, subsets):
+    keys = set(re.sub(r'(?<!^)(?=[A-Z][a-z])', '_', name).lower() for name in subsets.split('&'))
+    root = list(document)[0]
+    return {root: {key: value for key, value in document[root].items() if key in keys}}
+
+
+# Class: MockHandler
+# Routes requests to the generated tenant.
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def Send(self, code, body=None, headers=None):
+        data = json.dumps(body if body is not None else {}).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def Handle(self, method):
+        jamf = self.server.jamf
+        config = jamf.config
+        if config.latency or config.jitter:
+            time.sleep(config.latency + jamf.random.random() * config.jitter)
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        if method == 'POST' and self.path == '/api/v1/auth/token':
+            return self.Send(200, {'token': "mock-token-{}".format(time.time()), 'expires': time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime(time.time() + 1800))})
+        injected = jamf.Inject()
+        if injected == 429:
+            return self.Send(429, {}, {'Retry-After': str(config.retry_after)})
+        if injected:
+            return self.Send(injected)
+        path, _, query = self.path.partition('?')
+        path, _, subsets = path.partition('/subset/')
+        handler, params = Route(method, path)
+        if handler is None:
+            return self.Send(404)
+        code, body = handler(jamf, urllib.parse.parse_qs(query), *params)
+        if code == 200 and subsets and body:
+            body = Subset(body, subsets)
+        return self.Send(code, body)
+
+    def do_GET(self):
+        self.Handle('GET')
+
+    def do_DELETE(self):
+        self.Handle('DELETE')
+
+    def do_POST(self):
+        self.Handle('POST')
+
+
+def ListApps(jamf, query):
+    return 200, {'mobile_device_applications': [{'id': x, 'name': "App {}".format(x), 'bundle_id': "com.example.app{}".format(x),
+                                                 'version': "1.{}".format(x % 10)} for x in sorted(jamf.apps)]}
+
+def GetApp(jamf, query, app_id):
+    return (200, jamf.App(int(app_id))) if int(app_id) in jamf.apps else (404, None)
+
+def DeleteApp(jamf, query, app_id):
+    with jamf.lock:
+        if int(app_id) not in jamf.apps:
+            return 404, None
+        jamf.apps.discard(int(app_id))
+    return 200, {}
+
+def ListProfiles(jamf, query):
+    return 200, {'configuration_profiles': [{'id': x, 'name': "Profile {}".format(x)} for x in sorted(jamf.profiles)]}
+
+def GetProfile(jamf, query, profile_id):
+    return (200, jamf.Profile(int(profile_id))) if int(profile_id) in jamf.profiles else (404, None)
+
+def ListGroups(jamf, query):
+    return 200, {'mobile_device_groups': [{'id': x, 'name': "Group {}".format(x), 'is_smart': True} for x in range(1, jamf.config.groups + 1)]}
+
+def GetGroup(jamf, query, group_id):
+    return (200, jamf.Group(int(group_id))) if 1 <= int(group_id) <= jamf.config.groups else (404, None)
+
+def GetHistory(jamf, query, device_id):
+    return (200, jamf.History(int(device_id))) if 1 <= int(device_id) <= max(jamf.config.groups, 1) * jamf.config.devices else (404, None)
+
+def FlushDevice(jamf, query, device_id, status):
+    jamf.Flush([int(device_id)], status)
+    return 200, {}
+
+def FlushGroup(jamf, query, group_id, status):
+    if not jamf.config.group_flush:
+        return 404, None
+    code, group = GetGroup(jamf, query, group_id)
+    if code == 200:
+        jamf.Flush([device['id'] for device in group['mobile_device_group']['mobile_devices']], status)
+    return code, {}
+
+
+# Function: Page(query, ids, name)
+# Builds one page of a Jamf Pro API list from the page / page-size query parameters.
+# Returns (status, body)
+
+def Page(query, ids, name):
+    page = int(query.get('page', ['0'])[0])
+    page_size = int(query.get('page-size', ['100'])[0])
+    ids = sorted(ids)
+    results = [{'id': str(x), 'name': "{} {}".format(name, x)} for x in ids[page * page_size:(page + 1) * page_size]]
+    return 200, {'totalCount': len(ids), 'results': results}
+
+def PageApps(jamf, query):
+    return Page(query, jamf.apps, 'App')
+
+def PageProfiles(jamf, query):
+    return Page(query, jamf.profiles, 'Profile')
+
+
+ROUTES = [
+    ('GET', r'^/api/v1/mobile-device-apps$', PageApps),
+    ('GET', r'^/api/v1/mobile-device-configuration-profiles$', PageProfiles),
+    ('GET', r'^/JSSResource/mobiledeviceapplications$', ListApps),
+    ('GET', r'^/JSSResource/mobiledeviceapplications/id/(\d+)$', GetApp),
+    ('DELETE', r'^/JSSResource/mobiledeviceapplications/id/(\d+)$', DeleteApp),
+    ('GET', r'^/JSSResource/configurationprofiles$', ListProfiles),
+    ('GET', r'^/JSSResource/configurationprofiles/id/(\d+)$', GetProfile),
+    ('GET', r'^/JSSResource/mobiledevicegroups$', ListGroups),
+    ('GET', r'^/JSSResource/mobiledevicegroups/id/(\d+)$', GetGroup),
+    ('GET', r'^/JSSResource/mobiledevicehistory/id/(\d+)$', GetHistory),
+    ('DELETE', r'^/JSSResource/commandflush/mobiledevices/id/(\d+)/status/([\w+]+)$', FlushDevice),
+    ('DELETE', r'^/JSSResource/commandflush/mobiledevicegroups/id/(\d+)/status/([\w+]+)$', FlushGroup),
+]
+
+
+# Function: Route(method, path)
+# Returns (handler, params) for a request, or (None, None) if nothing matches
+
+def Route(method, path):
+    for route_method, pattern, handler in ROUTES:
+        match = re.match(pattern, path)
+        if route_method == method and match:
+            return handler, match.groups()
+    return None, None
+
+
+# Function: StartMockServer(config, port)
+# Starts the mock server on a background thread. Port 0 picks a free port.
+# Returns (server, url) - call server.shutdown() to stop it
+
+def StartMockServer(config, port=0):
+    server = ThreadingHTTPServer(('127.0.0.1', port), MockHandler)
+    server.daemon_threads = True
+    server.jamf = MockJamf(config)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, "http://127.0.0.1:{}".format(server.server_address[1])
+
+
+# Function: ParseArguments()
+# Parses command line flags
+# Returns args object
+
+def ParseArguments():
+    parser = argparse.ArgumentParser(description="Runs a local mock JAMF server. Example usage: jamf_mock_server.py --port 8080 --apps 1000 --latency 0.02")
+    parser.add_argument('--port', dest='port', type=int, default=8080, help='Port to listen on. (Default: 8080)')
+    parser.add_argument('--apps', dest='apps', type=int, default=100, help='Number of mobile device applications. (Default: 100)')
+    parser.add_argument('--profiles', dest='profiles', type=int, default=100, help='Number of configuration profiles. (Default: 100)')
+    parser.add_argument('--groups', dest='groups', type=int, default=10, help='Number of mobile device groups. (Default: 10)')
+    parser.add_argument('--devices', dest='devices', type=int, default=100, help='Number of devices in each group. (Default: 100)')
+    parser.add_argument('--latency', dest='latency', type=float, default=0.0, help='Seconds added to every response. (Default: 0)')
+    parser.add_argument('--jitter', dest='jitter', type=float, default=0.0, help='Up to this many random extra seconds per response. (Default: 0)')
+    parser.add_argument('--payload-size', dest='payload_size', type=int, default=1024, help='Bytes of filler in each document. (Default: 1024)')
+    parser.add_argument('--throttle-rate', dest='throttle_rate', type=float, default=0.0, help='Fraction of requests answered 429. (Default: 0)')
+    parser.add_argument('--error-rate', dest='error_rate', type=float, default=0.0, help='Fraction of requests answered 5xx. (Default: 0)')
+    parser.add_argument('--retry-after', dest='retry_after', type=int, default=1, help='Retry-After seconds sent with 429s. (Default: 1)')
+    parser.add_argument('--failure-rate', dest='failure_rate', type=float, default=0.0, help='Fraction of devices that start with failed commands. (Default: 0)')
+    parser.add_argument('--new-failures', dest='new_failures', type=float, default=0.0, help='Devices that get a newly failed command per minute. (Default: 0)')
+    parser.add_argument('--no-group-flush', dest='group_flush', action='store_false', help='Answer 404 to group command flushes like an older server.')
+    args = parser.parse_args()
+    return args
+
+
+# Main Function
+
+def main():
+    args = ParseArguments()
+    config = MockConfig(args.apps, args.profiles, args.groups, args.devices, args.latency, args.jitter,
+                        args.payload_size, args.throttle_rate, args.error_rate, args.retry_after, args.group_flush,
+                        failure_rate=args.failure_rate, new_failures=args.new_failures)
+    server, url = StartMockServer(config, args.port)
+    print("Mock JAMF server listening on {}".format(url))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        print("Served {} requests, {} command flushes".format(server.jamf.requests, server.jamf.flushes))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+# Copyright (c) 2021 jsd-git
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Adaptive rate limiting shared by every worker thread of a session. A token bucket paces requests;
+# when JAMF answers 429 or 503 every worker pauses for the Retry-After time and the rate is cut
+# (multiplicative decrease), and while requests succeed the rate climbs back (additive increase).
+# Until the first push back the rate grows quickly (slow start) so short runs are not held back.
+
+import email.utils
+import threading
+import time
+from requests.adapters import HTTPAdapter
+import jamf_metrics
+
+# ----------------------------------------------------------------------------------
+
+THROTTLE_STATUS_CODES = (429, 503)
+DEFAULT_START_RATE = 20.0
+DEFAULT_MAX_RATE = 200.0
+DEFAULT_RETRY_AFTER = 5.0 # Seconds to pause when a 429/503 has no Retry-After header
+
+
+# Class: AdaptiveRateLimiter(start_rate, max_rate, min_rate, increase, decrease)
+# Token bucket whose rate (requests per second) follows AIMD. Safe to share between threads.
+
+class AdaptiveRateLimiter:
+    def __init__(self, start_rate=DEFAULT_START_RATE, max_rate=DEFAULT_MAX_RATE, min_rate=0.5, increase=10.0, decrease=0.7):
+        self.rate = min(start_rate, max_rate)
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.lock = threading.Lock()
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self.slow_start = True
+        self.throttled = 0
+
+    # Function: Acquire()
+    # Blocks until this thread may send a request.
+    # Void Return
+
+    def Acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(max(self.rate / 10, 1.0), self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                else:
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    # Function: OnSuccess()
+    # Raises the rate after a request the server accepted.
+    # Void Return
+
+    def OnSuccess(self):
+        with self.lock:
+            step = self.rate * 0.05 if self.slow_start else self.increase / self.rate
+            self.rate = min(self.max_rate, self.rate + step)
+
+    # Function: OnThrottle(retry_after)
+    # Pauses every worker for retry_after seconds and cuts the rate. Many workers tend to be
+    # throttled at once, so the rate is only cut once per pause.
+    # Void Return
+
+    def OnThrottle(self, retry_after):
+        with self.lock:
+            now = time.monotonic()
+            self.throttled += 1
+            self.slow_start = False
+            self.paused_until = max(self.paused_until, now + retry_after)
+            if now - self.last_decrease >= max(retry_after, 1.0):
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                self.last_decrease = now
+            self.tokens = 0.0
+
+
+# Function: RetryAfter(response)
+# Reads the Retry-After header of a response, given in seconds or as an HTTP date.
+# Returns seconds to wait
+
+def RetryAfter(response):
+    value = response.headers.get('Retry-After')
+    if not value:
+        return DEFAULT_RETRY_AFTER
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER
+
+
+# Class: RateLimitedAdapter(limiter, max_attempts, timeout, **kwargs)
+# HTTPAdapter that takes a token from the limiter before every request and retries 429/503
+# responses itself (up to max_attempts sends) after the pause the server asked for.
+# Requests sent without a timeout get `timeout` seconds, so a stalled connection can't hang a worker.
+# Time spent waiting on the limiter is recorded as the 'rate_limit' stage, and the time of the final
+# attempt alone is kept on response.attempt_elapsed (response.elapsed also counts the waits and retries).
+
+class RateLimitedAdapter(HTTPAdapter):
+    def __init__(self, limiter, max_attempts=6, timeout=None, **kwargs):
+        self.limiter = limiter
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        for attempt in range(self.max_attempts):
+            with jamf_metrics.Stage('rate_limit'):
+                self.limiter.Acquire()
+            started = time.perf_counter()
+            response = super().send(request, **kwargs)
+            response.attempt_elapsed = time.perf_counter() - started
+            if response.status_code not in THROTTLE_STATUS_CODES:
+                self.limiter.OnSuccess()
+                return response
+            if jamf_metrics.ACTIVE is not None:
+                jamf_metrics.ACTIVE.Count('throttled')
+            if attempt == self.max_attempts - 1:
+                return response
+            self.limiter.OnThrottle(RetryAfter(response))
+            response.close()
+        return response
+
+
+# Function: AddRateLimitArguments(parser)
+# Adds the --start-rate and --max-rate flags to a script's argument parser.
+# Void Return
+
+def AddRateLimitArguments(parser):
+    parser.add_argument('--start-rate', dest='start_rate', type=float, default=DEFAULT_START_RATE, help='Requests per second to start at. The rate adapts to how JAMF responds. (Default: {})'.format(DEFAULT_START_RATE))
+    parser.add_argument('--max-rate', dest='max_rate', type=float, default=DEFAULT_MAX_RATE, help='Never send more than this many requests per second. (Default: {})'.format(DEFAULT_MAX_RATE))
+
+
+# Function: RateLimiterFromArgs(args)
+# Builds the limiter described by the flags from AddRateLimitArguments.
+# Returns AdaptiveRateLimiter
+
+def RateLimiterFromArgs(args):
+    return AdaptiveRateLimiter(args.start_rate, args.max_rate)
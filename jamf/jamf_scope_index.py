@@ -0,0 +1,227 @@
+# Copyright (c) 2021 jsd-git
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Inverted scope index: mobile device group -> the apps and profiles scoped to it, plus the objects
+# scoped to all devices or all users. The exporters build it from the records they already stream
+# (--scope-index scope.json) and write it as a small JSON sidecar next to the CSV. Apps and profiles
+# exported to the same file are merged. Look groups or objects up with this script instead of
+# re-reading the scope column of every CSV row.
+# Example usage: jamf_scope_index.py --index scope.json group 185
+
+import argparse
+import json
+import os
+import sys
+import time
+
+# ----------------------------------------------------------------------------------
+
+KINDS = ('apps', 'profiles')
+
+
+# Class: ScopeIndex()
+# Collects the scope of exported apps and profiles.
+
+class ScopeIndex:
+    def __init__(self):
+        self.groups = {}                                  # group id -> {'name': name, 'apps': set, 'profiles': set}
+        self.all_devices = {kind: set() for kind in KINDS}
+        self.all_users = {kind: set() for kind in KINDS}
+        self.names = {kind: {} for kind in KINDS}         # kind -> {object id: name}
+
+    # Function: Add(kind, record)
+    # Indexes one exported app or profile record (anything with id, name, scope, scope_all and scope_all_users).
+    # Records exported without their scope are skipped.
+    # Void Return
+
+    def Add(self, kind, record):
+        if record.get('id') is None or record.get('scope') is None:
+            return
+        object_id = int(record['id'])
+        self.names[kind][object_id] = record.get('name')
+        for group in record['scope']:
+            entry = self.groups.setdefault(int(group['id']), {'name': group.get('name'), 'apps': set(), 'profiles': set()})
+            entry[kind].add(object_id)
+        if record.get('scope_all'):
+            self.all_devices[kind].add(object_id)
+        if record.get('scope_all_users'):
+            self.all_users[kind].add(object_id)
+
+    # Function: Track(kind, records)
+    # Indexes records as they stream past, e.g. between FetchAppInfo and WriteToCSV.
+    # Yields the records unchanged
+
+    def Track(self, kind, records):
+        for record in records:
+            self.Add(kind, record)
+            yield record
+
+    # Function: Write(filename, resume)
+    # Saves the index, merged with the one already in filename. Each kind indexed in this run replaces the
+    # saved entries of that kind, unless resume is set (a resumed export only saw the remaining objects),
+    # in which case only the objects seen again are replaced.
+    # Void Return
+
+    def Write(self, filename, resume=False):
+        index = LoadIndex(filename) if os.path.exists(filename) else EmptyIndex()
+        for kind in KINDS:
+            if not self.names[kind]:
+                continue
+            replaced = set(self.names[kind])
+            keep = lambda object_id: resume and object_id not in replaced
+            for table in [group for group in index['groups'].values()] + [index['all_devices'], index['all_users']]:
+                table[kind] = [object_id for object_id in table[kind] if keep(object_id)]
+            index['names'][kind] = {object_id: name for object_id, name in index['names'][kind].items() if keep(int(object_id))}
+            for group_id, entry in self.groups.items():
+                saved = index['groups'].setdefault(str(group_id), {'name': entry['name'], 'apps': [], 'profiles': []})
+                saved['name'] = entry['name'] or saved['name']
+                saved[kind] = sorted(set(saved[kind]) | entry[kind])
+            index['all_devices'][kind] = sorted(set(index['all_devices'][kind]) | self.all_devices[kind])
+            index['all_users'][kind] = sorted(set(index['all_users'][kind]) | self.all_users[kind])
+            index['names'][kind].update({str(object_id): name for object_id, name in self.names[kind].items()})
+        index['groups'] = {group_id: entry for group_id, entry in index['groups'].items() if entry['apps'] or entry['profiles']}
+        index['generated'] = time.time()
+        temp_name = filename + ".tmp"
+        with open(temp_name, 'w') as file:
+            json.dump(index, file, separators=(',', ':'))
+        os.replace(temp_name, filename)
+
+
+# Function: EmptyIndex()
+# Returns the on-disk form of an index with nothing in it
+
+def EmptyIndex():
+    return {'generated': None, 'groups': {}, 'all_devices': {kind: [] for kind in KINDS},
+            'all_users': {kind: [] for kind in KINDS}, 'names': {kind: {} for kind in KINDS}}
+
+
+# Function: LoadIndex(filename)
+# Reads a scope index sidecar.
+# Returns index dictionary (group ids and object ids in names are strings, as JSON keys are)
+
+def LoadIndex(filename):
+    with open(filename, 'r') as file:
+        return json.load(file)
+
+
+# Function: AddScopeIndexArguments(parser)
+# Adds the --scope-index flag to an exporter's argument parser.
+# Void Return
+
+def AddScopeIndexArguments(parser):
+    parser.add_argument('--scope-index', dest='scope_index', type=str, help='Also write a group -> apps/profiles scope index to this JSON file (merged with what is already in it). Look it up with jamf_scope_index.py.')
+
+
+# Function: ScopeIndexFromArgs(args)
+# Returns a ScopeIndex if --scope-index was given, otherwise None
+
+def ScopeIndexFromArgs(args):
+    return ScopeIndex() if args.scope_index else None
+
+
+# Function: FindGroup(index, group)
+# Finds a group by id or by (case insensitive) name.
+# Returns (group id, entry), or (None, None) if the index has no such group
+
+def FindGroup(index, group):
+    if group in index['groups']:
+        return group, index['groups'][group]
+    for group_id, entry in index['groups'].items():
+        if (entry['name'] or '').lower() == group.lower():
+            return group_id, entry
+    return None, None
+
+
+# Function: LookupGroup(index, group)
+# Lists what lands on a group: the objects scoped to it and the ones scoped to all devices.
+# Returns list of (kind, id, name, via) tuples
+
+def LookupGroup(index, group):
+    group_id, entry = FindGroup(index, group)
+    rows = []
+    for kind in KINDS:
+        direct = set(entry[kind]) if entry else set()
+        for object_id in sorted(direct | set(index['all_devices'][kind])):
+            via = "group {}".format(group_id) if object_id in direct else "all devices"
+            rows.append((kind, object_id, index['names'][kind].get(str(object_id)), via))
+    return rows
+
+
+# Function: LookupObject(index, kind, object_id)
+# Lists the groups an app or profile is scoped to, plus its all devices / all users flags.
+# Returns list of (group id, group name) tuples and a list of flags
+
+def LookupObject(index, kind, object_id):
+    groups = [(group_id, entry['name']) for group_id, entry in index['groups'].items() if object_id in entry[kind]]
+    flags = [flag for flag in ('all_devices', 'all_users') if object_id in index[flag][kind]]
+    return sorted(groups, key=lambda group: int(group[0])), flags
+
+
+# Function: ParseArguments()
+# Parses command line flags
+# Returns args object
+
+def ParseArguments():
+    parser = argparse.ArgumentParser(description="Looks up a scope index written by jamf_export_apps.py / jamf_export_config_profiles.py --scope-index. Example usage: jamf_scope_index.py --index scope.json group 185")
+    parser.add_argument('--index', dest='index', type=str, help='The scope index file.', required=True)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    group = subparsers.add_parser('group', help='Apps and profiles that land on a group (scoped to it or to all devices).')
+    group.add_argument('group', type=str, help='Group id or name.')
+    app = subparsers.add_parser('app', help='Groups an app is scoped to.')
+    app.add_argument('object_id', type=int, help='App id.')
+    profile = subparsers.add_parser('profile', help='Groups a profile is scoped to.')
+    profile.add_argument('object_id', type=int, help='Profile id.')
+    subparsers.add_parser('all-devices', help='Apps and profiles scoped to all devices.')
+    subparsers.add_parser('all-users', help='Apps and profiles scoped to all users.')
+    subparsers.add_parser('groups', help='Every group with its number of scoped apps and profiles.')
+    args = parser.parse_args()
+    return args
+
+
+# Main Function
+
+def main():
+    args = ParseArguments()
+    try:
+        index = LoadIndex(args.index)
+    except (IOError, ValueError) as error:
+        sys.exit("Could not read {}: {}".format(args.index, error))
+    if args.command == 'group':
+        if FindGroup(index, args.group)[0] is None:
+            print("Nothing is scoped to group {} directly.".format(args.group), file=sys.stderr)
+        for kind, object_id, name, via in LookupGroup(index, args.group):
+            print("{},{},{},{}".format(kind, object_id, name, via))
+    elif args.command in ('app', 'profile'):
+        groups, flags = LookupObject(index, args.command + 's', args.object_id)
+        for flag in flags:
+            print(flag)
+        for group_id, name in groups:
+            print("{},{}".format(group_id, name))
+    elif args.command in ('all-devices', 'all-users'):
+        table = index[args.command.replace('-', '_')]
+        for kind in KINDS:
+            for object_id in table[kind]:
+                print("{},{},{}".format(kind, object_id, index['names'][kind].get(str(object_id))))
+    else:
+        for group_id, entry in sorted(index['groups'].items(), key=lambda item: int(item[0])):
+            print("{},{},{} apps,{} profiles".format(group_id, entry['name'], len(entry['apps']), len(entry['profiles'])))
+
+if __name__ == "__main__":
+    main()
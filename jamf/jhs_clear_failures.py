@@ -17,37 +17,290 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
-
-import requests
-import json
+import time
+import argparse
 import datetime
-print(datetime.datetime.now())
-basejss = "https://my.jamfcloud.com/JSSResource"
-smart_group_id = 185 # Use API to grab Smart Group ID #
-jssm = basejss + "/mobiledevicegroups/id/{}".format(str(smart_group_id))
-jss_user = "API_USER"
-jss_password = "super_secret"
-jss_headers = {
-    'Content-Type': 'application/json',
-    'Accept': 'application/json',
-}
-s = requests.Session()
-s.auth = (jss_user, jss_password)
-s.headers.update(jss_headers)
-
-jss_response = s.get(jssm)
-jss_json = json.loads(jss_response.text)
-group = jss_json["mobile_device_group"]
-devices = group["mobile_devices"]
-print("Gathering IDs")
-ids = []
-for x in range(len(devices)):
-    device = devices[x]
-    ids.append(device['id'])
-
-
-print("Removing Failed Commands - This may take 20+ minutes based on inventory size.")
-for y in ids:
-    getmdurl = basejss + "/commandflush/mobiledevices/id/{}/status/Failed".format(str(y))
-    dcommand = s.delete(getmdurl)
-    print("Deleted Fled Commands for ID: {} - Response was: {}".format(str(y), dcommand))
+import json
+import math
+import os
+from jamf_client import CreateSession
+from jamf_decode import DecodeResponse
+from jamf_fetch import FetchConcurrent
+from jamf_metrics import AddProfileArguments, EnableProfiling, Stage
+from jamf_ratelimit import AddRateLimitArguments, RateLimiterFromArgs
+
+# ----------------------------------------------------------------------------------
+
+# Status codes the group flush endpoint returns on servers that do not support it
+UNSUPPORTED_STATUS = (400, 404, 405, 501)
+
+# Function: ParseArguments()
+# Parses command line flags
+# Returns args object
+def ParseArguments():
+    parser = argparse.ArgumentParser(description="This program clears failed MDM commands for every mobile device in a group. Example usage: jhs_clear_failures.py --url https://sub.jamfcloud.com --group 185 --user testinguser --pass supersecret")
+    parser.add_argument('--url', dest='jssurl', type=str, help='Your JAMF URL. (Must include https://) Example: https://sub.jamfcloud.com', required=True)
+    parser.add_argument('--group', dest='group_id', type=int, help='ID of the (smart) mobile device group to clear. Use the API to grab the group ID.', required=True)
+    parser.add_argument('--user', dest='username', type=str, help='Your JAMF username.', required=True)
+    parser.add_argument('--pass',dest='password', type=str, help='Your JAMF password.', required=True)
+    parser.add_argument('--status', dest='status', type=str, default='Failed', choices=['Failed', 'Pending', 'Pending+Failed'], help='Which commands to clear. (Default: Failed)')
+    parser.add_argument('--mode', dest='mode', type=str, default='auto', choices=['auto', 'group', 'device'], help='group: one flush call for the whole group. device: one call per device. auto: try group, fall back to device. (Default: auto)')
+    parser.add_argument('--workers', dest='workers', type=int, default=4, help='Number of per-device flushes to run at the same time. (Default: 4)')
+    parser.add_argument('--watch', dest='watch', action='store_true', help='Keep running: every --interval seconds flush only new group members and devices with failed commands. (Ignores --mode)')
+    parser.add_argument('--interval', dest='interval', type=float, default=300, help='Seconds between the starts of two watch cycles. (Default: 300)')
+    parser.add_argument('--revalidate', dest='revalidate', type=float, default=0.1, help='Fraction of known members whose command history is checked each watch cycle, least recently checked first. (Default: 0.1)')
+    parser.add_argument('--state-file', dest='state_file', type=str, help='Keep the watched membership in this file so a restart does not flush everyone again.')
+    parser.add_argument('--status-file', dest='status_file', type=str, help='Write the duration and counts of the last watch cycle to this JSON file.')
+    parser.add_argument('--cycles', dest='cycles', type=int, default=0, help='Stop watching after this many cycles. (Default: 0, run until stopped)')
+    AddRateLimitArguments(parser)
+    AddProfileArguments(parser)
+    args = parser.parse_args()
+    return args
+
+
+# Function: FetchGroupMembers(jss_url, session, group_id)
+# Queries JAMF API for a mobile device group and extracts the ids of its members into an array.
+# Returns ids array
+
+def FetchGroupMembers(jss_url, session, group_id):
+    jss = jss_url + "/JSSResource/mobiledevicegroups/id/{}".format(str(group_id))
+    jss_response = session.get(jss)
+    jss_response.raise_for_status()
+    jss_json = DecodeResponse(jss_response)
+    devices = jss_json["mobile_device_group"]["mobile_devices"]
+    ids = []
+    for device in devices:
+        ids.append(device['id'])
+    return ids
+
+
+# Function: FlushGroup(jss_url, session, group_id, status)
+# Clears the commands of every device in the group with a single group-scoped commandflush call.
+# Returns True on success, False if the server does not support flushing by group
+
+def FlushGroup(jss_url, session, group_id, status):
+    jss = jss_url + "/JSSResource/commandflush/mobiledevicegroups/id/{}/status/{}".format(str(group_id), status)
+    response = session.delete(jss)
+    if response.status_code in UNSUPPORTED_STATUS:
+        return False
+    response.raise_for_status()
+    return True
+
+
+# Function: FlushDevice(jss_url, session, device_id, status)
+# Clears the commands of a single mobile device.
+# Returns the response status code
+
+def FlushDevice(jss_url, session, device_id, status):
+    jss = jss_url + "/JSSResource/commandflush/mobiledevices/id/{}/status/{}".format(str(device_id), status)
+    response = session.delete(jss)
+    response.raise_for_status()
+    return response.status_code
+
+
+# Function: FlushDevices(jss_url, session, ids, status, workers, failed_ids)
+# Clears the commands of every device in ids, `workers` devices at a time, printing progress with an ETA
+# and a throughput summary at the end. A device that fails is reported (and added to failed_ids if given)
+# and does not stop the run.
+# Returns (flushed, failed) counts
+
+def FlushDevices(jss_url, session, ids, status, workers=4, failed_ids=None):
+    flushed = 0
+    failed = 0
+    start = time.monotonic()
+    last_report = start
+    flush_one = lambda device_id: FlushDevice(jss_url, session, device_id, status)
+    for device_id, code, error in FetchConcurrent(flush_one, ids, workers):
+        if error is not None:
+            failed += 1
+            print("Failed to clear commands for ID: {} - {}".format(str(device_id), error))
+            if failed_ids is not None:
+                failed_ids.append(device_id)
+        else:
+            flushed += 1
+        now = time.monotonic()
+        if now - last_report >= 5 or flushed + failed == len(ids):
+            last_report = now
+            PrintProgress(flushed + failed, len(ids), now - start)
+    elapsed = time.monotonic() - start
+    print("Cleared {} commands for {} devices ({} failed) in {:.1f}s - {:.1f} devices/s".format(status, flushed, failed, elapsed, (flushed + failed) / elapsed if elapsed else 0))
+    return flushed, failed
+
+
+# Function: PrintProgress(done, total, elapsed)
+# Prints how many devices are done, the current rate and the estimated time left.
+# Void Return
+
+def PrintProgress(done, total, elapsed):
+    rate = done / elapsed if elapsed else 0
+    eta = (total - done) / rate if rate else 0
+    print("{}/{} devices ({:.0%}) - {:.1f} devices/s - ETA {}".format(done, total, done / total if total else 1, rate, datetime.timedelta(seconds=int(eta))))
+
+
+# Function: ClearFailures(jss_url, session, group_id, status, mode, workers)
+# Clears the commands of every device in a group: with one group flush when mode allows and the server
+# supports it, otherwise one flush per device, `workers` at a time.
+# Returns dictionary with the mode used and the flushed / failed device counts
+
+def ClearFailures(jss_url, session, group_id, status, mode='auto', workers=4):
+    if mode in ('auto', 'group'):
+        print("Removing {} Commands for group {} with a single group flush.".format(status, group_id))
+        if FlushGroup(jss_url, session, group_id, status):
+            print("Group flush complete.")
+            return {'mode': 'group', 'flushed': None, 'failed': 0}
+        if mode == 'group':
+            print("This server does not support flushing commands by group.")
+            return {'mode': 'group', 'flushed': 0, 'failed': None}
+        print("Group flush is not supported by this server, falling back to flushing each device.")
+    print("Gathering IDs")
+    with Stage('list_ids'):
+        ids = FetchGroupMembers(jss_url, session, group_id)
+    print("Removing {} Commands for {} devices, {} at a time.".format(status, len(ids), workers))
+    flushed, failed = FlushDevices(jss_url, session, ids, status, workers)
+    return {'mode': 'device', 'flushed': flushed, 'failed': failed}
+
+
+# Function: FetchCommandCounts(jss_url, session, device_id)
+# Queries the management command history of a mobile device.
+# Returns {'Failed': count, 'Pending': count} dictionary
+
+def FetchCommandCounts(jss_url, session, device_id):
+    jss = jss_url + "/JSSResource/mobiledevicehistory/id/{}/subset/ManagementCommands".format(str(device_id))
+    jss_response = session.get(jss)
+    jss_response.raise_for_status()
+    commands = DecodeResponse(jss_response)["mobile_device_history"]["management_commands"]
+    return {'Failed': len(commands.get('failed') or []), 'Pending': len(commands.get('pending') or [])}
+
+
+# Function: LoadState(filename)
+# Reads the watch state left by an earlier run.
+# Returns {'members': {device id: last checked}, 'retry': [device ids]} dictionary (empty on the first run)
+
+def LoadState(filename):
+    state = {'members': {}, 'retry': []}
+    if filename:
+        try:
+            with open(filename, 'r') as file:
+                saved = json.load(file)
+            state['members'] = {int(device_id): checked for device_id, checked in saved['members'].items()}
+            state['retry'] = saved.get('retry', [])
+        except (IOError, ValueError, KeyError):
+            pass
+    return state
+
+
+# Function: WriteJSON(filename, data)
+# Replaces a JSON file in one step so readers never see a half written file.
+# Void Return
+
+def WriteJSON(filename, data):
+    temp_name = filename + ".tmp"
+    with open(temp_name, 'w') as file:
+        json.dump(data, file, indent=2)
+    os.replace(temp_name, filename)
+
+
+# Function: WatchCycle(jss_url, session, args, state)
+# One watch cycle. New members and devices whose flush failed last cycle are flushed straight away. Of the
+# other members, the least recently checked --revalidate fraction has its command history read and is
+# flushed only if it has commands in --status. Everyone else is left alone, so a quiet cycle costs one
+# group lookup plus a few history reads instead of a flush per device.
+# Returns dictionary of counts for the cycle
+
+def WatchCycle(jss_url, session, args, state):
+    now = time.time()
+    with Stage('list_ids'):
+        members = FetchGroupMembers(jss_url, session, args.group_id)
+    known = state['members']
+    current = set(members)
+    removed = [device_id for device_id in known if device_id not in current]
+    for device_id in removed:
+        del known[device_id]
+    new = [device_id for device_id in members if device_id not in known]
+    retry = [device_id for device_id in state['retry'] if device_id in known]
+    skip = set(retry)
+    candidates = sorted((checked, device_id) for device_id, checked in known.items() if device_id not in skip)
+    check = [device_id for checked, device_id in candidates[:math.ceil(len(candidates) * args.revalidate)]]
+
+    failing = []
+    check_failed = 0
+    fetch_one = lambda device_id: FetchCommandCounts(jss_url, session, device_id)
+    for device_id, counts, error in FetchConcurrent(fetch_one, check, args.workers):
+        if error is not None:
+            check_failed += 1
+            print("Failed to read the command history of ID: {} - {}".format(str(device_id), error))
+            continue
+        known[device_id] = now
+        if any(counts[status] for status in args.status.split('+')):
+            failing.append(device_id)
+
+    to_flush = new + retry + failing
+    failed_ids = []
+    flushed = 0
+    if to_flush:
+        print("Removing {} Commands for {} devices ({} new, {} retried, {} with commands to clear).".format(args.status, len(to_flush), len(new), len(retry), len(failing)))
+        flushed = FlushDevices(jss_url, session, to_flush, args.status, args.workers, failed_ids)[0]
+    for device_id in new:
+        known[device_id] = now
+    state['retry'] = failed_ids
+    return {'members': len(members), 'new': len(new), 'removed': len(removed), 'checked': len(check) - check_failed,
+            'check_failed': check_failed, 'with_failures': len(failing), 'flushed': flushed, 'flush_failed': len(failed_ids)}
+
+
+# Function: Watch(jss_url, session, args)
+# Runs WatchCycle every --interval seconds until interrupted (or for --cycles cycles), saving the state
+# and the last cycle's duration and counts to --state-file / --status-file after every cycle.
+# Void Return
+
+def Watch(jss_url, session, args):
+    state = LoadState(args.state_file)
+    totals = {'flushed': 0, 'flush_failed': 0, 'cycle_errors': 0}
+    cycle = 0
+    try:
+        while True:
+            cycle += 1
+            started = time.time()
+            start = time.monotonic()
+            try:
+                counts = WatchCycle(jss_url, session, args, state)
+            except Exception as error:
+                counts = {'error': str(error)}
+                totals['cycle_errors'] += 1
+            duration = time.monotonic() - start
+            totals['flushed'] += counts.get('flushed', 0)
+            totals['flush_failed'] += counts.get('flush_failed', 0)
+            if args.state_file:
+                WriteJSON(args.state_file, {'members': state['members'], 'retry': state['retry']})
+            status = {'cycle': cycle, 'started': datetime.datetime.fromtimestamp(started).isoformat(timespec='seconds'),
+                      'duration_s': round(duration, 3), 'last_cycle': counts, 'totals': totals,
+                      'next_cycle': datetime.datetime.fromtimestamp(started + max(args.interval, duration)).isoformat(timespec='seconds')}
+            if args.status_file:
+                WriteJSON(args.status_file, status)
+            if 'error' in counts:
+                print("{} cycle {} failed after {:.1f}s: {}".format(datetime.datetime.now().isoformat(timespec='seconds'), cycle, duration, counts['error']))
+            else:
+                print("{} cycle {} took {:.1f}s: {}".format(datetime.datetime.now().isoformat(timespec='seconds'), cycle, duration,
+                                                           ", ".join("{} {}".format(value, name) for name, value in counts.items())))
+            if args.cycles and cycle >= args.cycles:
+                return
+            time.sleep(max(args.interval - (time.monotonic() - start), 0))
+    except KeyboardInterrupt:
+        print("Stopped watching after {} cycles.".format(cycle))
+
+
+# Main Function
+
+def main():
+    print(datetime.datetime.now())
+    args = ParseArguments()
+    basejss = args.jssurl
+    session = CreateSession(basejss, args.username, args.password, args.workers, limiter=RateLimiterFromArgs(args))
+    EnableProfiling(session, args)
+    if args.watch:
+        Watch(basejss, session, args)
+    else:
+        ClearFailures(basejss, session, args.group_id, args.status, args.mode, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -19,10 +19,23 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-import csv
-import requests
 import json
 import argparse
+import datetime
+import gzip
+import hashlib
+import os
+import sys
+import tarfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'jamf'))
+from jamf_cache import AddCacheArguments, CacheFromArgs
+from jamf_client import CreateSession, FetchObject
+from jamf_decode import DecodeResponse
+from jamf_fetch import FetchConcurrent, ReportFailures
+from jamf_ids import AddPagingArguments, IterIDs
+from jamf_metrics import AddProfileArguments, EnableProfiling, Stage
+from jamf_ratelimit import AddRateLimitArguments, RateLimiterFromArgs
 
 # ----------------------------------------------------------------------------------
 
@@ -31,25 +44,21 @@ import argparse
 # Returns Session
 
 def ParseArguments():
-    parser = argparse.ArgumentParser(description="Example usage: jamf_export_apps.py --url https://sub.jamfcloud.com --file export.csv --user testinguser --pass supersecret")
+    parser = argparse.ArgumentParser(description="Backs up every configuration profile to a content-addressed store, only writing profiles that changed since the last run. Example usage: jamf_backup_apps.py --url https://sub.jamfcloud.com --dir backups --user testinguser --pass supersecret")
     parser.add_argument('--url', dest='jssurl', type=str, help='Your JAMF URL. (Must include https://) Example: https://sub.jamfcloud.com', required=True)
-    parser.add_argument('--file', dest='filename', type=str, help='The filename you would like to save the export as.', required=True)
+    parser.add_argument('--dir', dest='directory_name', type=str, help='The directory you would like to keep the backups in.', required=True)
     parser.add_argument('--user', dest='username', type=str, help='Your JAMF username.', required=True)
     parser.add_argument('--pass',dest='password', type=str, help='Your JAMF password.', required=True)
+    parser.add_argument('--workers', dest='workers', type=int, default=1, help='Number of profiles to fetch at the same time. (Default: 1)')
+    parser.add_argument('--gzip', dest='compress', action='store_true', help='Store new profiles gzip compressed.')
+    parser.add_argument('--tar', dest='package', action='store_true', help='Also package this run (manifest and every profile it references) into a .tar.gz under <dir>/archives.')
+    AddPagingArguments(parser)
+    AddCacheArguments(parser)
+    AddRateLimitArguments(parser)
+    AddProfileArguments(parser)
     args = parser.parse_args()
     return args
 
-# Function: CreateSession(username, password)
-# Creates a session with authentication credentials and requried headers.
-# Returns Session
-
-def CreateSession(username, password):
-    jss_headers = {'Content-Type':'application/json','Accept':'application/json'}
-    s = requests.Session()
-    s.auth = (username, password)
-    s.headers.update(jss_headers)
-    return s
-
 # Function: FetchIDS(jss_url, session)
 # Queries JAMF API for all Configuration Profiles and extracts their app ids into an array.
 # Returns config_ids array
@@ -58,41 +67,116 @@ def FetchIDS(jss_url, session):
     config_ids = []
     jss = jss_url + "/JSSResource/configurationprofiles"
     jss_response = session.get(jss)
-    print(jss_response) # Testing
-    jss_json = json.loads(jss_response.text)
-    print(jss_json)
+    jss_response.raise_for_status()
+    jss_json = DecodeResponse(jss_response)
     for profile in jss_json["configuration_profiles"]:
         config_ids.append(profile["id"])
-    print (config_ids)
     return config_ids
 
-# Function: FetchConfigData(jss_url, session, config_ids)
-# Queries JAMF API for each Configuration Profiles data and puts that data into a dictionary config_data
-# Returns config_data
-
-def FetchConfigData(jss_url, session, config_ids):
-    config_data = {}
-    for id in config_ids:
-        jss = jss_url + "/JSSResource/configurationprofiles/id/" + str(id)
-        jss_response = session.get(jss)
-        jss_json = json.loads(jss_response.text)
-        config_data[id] = jss_json
-    print (config_data)
-    return (config_data)
+# Function: FetchConfigData(jss_url, session, config_ids, workers, cache, refresh)
+# Queries JAMF API for each Configuration Profiles data, `workers` at a time, and yields each one as soon as it arrives
+# Profiles already in the response cache (e.g. from jamf_export_config_profiles.py) are not downloaded again unless refresh is set
+# Profiles that fail to fetch are reported at the end and left out
+# Yields (id, config_data) tuples
+
+def FetchConfigData(jss_url, session, config_ids, workers=1, cache=None, refresh=False):
+    failures = []
+    fetch_one = lambda id: FetchObject(session, jss_url, "configurationprofiles", id, cache, refresh)
+    for id, config_data, error in FetchConcurrent(fetch_one, config_ids, workers):
+        if error is not None:
+            failures.append((id, error))
+            continue
+        yield id, config_data
+    ReportFailures(failures, "configuration profiles")
 
 # Function: CreateDirectory(directory_name)
-# Creates a directory to put the data in
-# Returns success statement
+# Creates the backup store layout:
+#   <directory_name>/objects/ab/abcd....json[.gz] - one file per distinct profile, named by the sha256 of its contents
+#   <directory_name>/manifests/<timestamp>.json   - which profile id had which hash on each run
+#   <directory_name>/archives/<timestamp>.tar.gz  - optional packaged copy of a run (--tar)
+# Returns directory_name
 
 def CreateDirectory(directory_name):
-    pass
-
-# Function: WriteXMLToFiles(config_data, directory_name, file_name)
-# Writes the config_data to an XML file
-# Returns success statement
-
-def WriteXMLToFiles(config_data, directory_name, file_name):
-    pass
+    for sub_directory in ('objects', 'manifests', 'archives'):
+        os.makedirs(os.path.join(directory_name, sub_directory), exist_ok=True)
+    return directory_name
+
+# Function: ObjectPath(directory_name, digest, compress)
+# Returns the path a profile with the given hash is stored at
+
+def ObjectPath(directory_name, digest, compress=False):
+    return os.path.join(directory_name, 'objects', digest[:2], digest + ('.json.gz' if compress else '.json'))
+
+# Function: FindObject(directory_name, digest)
+# Looks for a stored profile, compressed or not.
+# Returns the path, or None if the profile is not stored yet
+
+def FindObject(directory_name, digest):
+    for compress in (False, True):
+        path = ObjectPath(directory_name, digest, compress)
+        if os.path.exists(path):
+            return path
+    return None
+
+# Function: WriteProfileObject(config_data, directory_name, compress)
+# Writes one profile to the store under the sha256 of its canonical json. Profiles that are
+# already stored (unchanged since an earlier run) are not written again.
+# Returns (digest, written)
+
+def WriteProfileObject(config_data, directory_name, compress=False):
+    data = json.dumps(config_data, sort_keys=True, separators=(',', ':')).encode()
+    digest = hashlib.sha256(data).hexdigest()
+    if FindObject(directory_name, digest) is not None:
+        return digest, False
+    path = ObjectPath(directory_name, digest, compress)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = path + '.tmp'
+    if compress:
+        with gzip.GzipFile(temp_path, 'wb', mtime=0) as file:
+            file.write(data)
+    else:
+        with open(temp_path, 'wb') as file:
+            file.write(data)
+    os.replace(temp_path, path)
+    return digest, True
+
+# Function: WriteManifest(manifest, directory_name, stamp)
+# Writes the manifest of a run as compact json.
+# Returns manifest path
+
+def WriteManifest(manifest, directory_name, stamp):
+    path = os.path.join(directory_name, 'manifests', stamp + '.json')
+    with open(path + '.tmp', 'w') as file:
+        json.dump(manifest, file, separators=(',', ':'))
+    os.replace(path + '.tmp', path)
+    return path
+
+# Function: PackageBackup(manifest_path, manifest, directory_name, stamp)
+# Packages a run's manifest and every profile it references into <directory_name>/archives/<stamp>.tar.gz
+# Returns archive path
+
+def PackageBackup(manifest_path, manifest, directory_name, stamp):
+    path = os.path.join(directory_name, 'archives', stamp + '.tar.gz')
+    with tarfile.open(path, 'w:gz') as archive:
+        archive.add(manifest_path, arcname=os.path.join('manifests', stamp + '.json'))
+        for digest in sorted(set(entry['sha256'] for entry in manifest['profiles'].values())):
+            object_path = FindObject(directory_name, digest)
+            archive.add(object_path, arcname=os.path.relpath(object_path, directory_name))
+    return path
+
+# Function: BackupProfiles(profiles, directory_name, compress)
+# Streams (id, config_data) pairs into the store as they arrive and builds the manifest for the run.
+# Returns manifest dictionary
+
+def BackupProfiles(profiles, directory_name, compress=False):
+    manifest = {'created': datetime.datetime.now().isoformat(), 'profiles': {}, 'written': 0, 'unchanged': 0}
+    for id, config_data in profiles:
+        with Stage('store'):
+            digest, written = WriteProfileObject(config_data, directory_name, compress)
+        name = config_data.get('configuration_profile', {}).get('general', {}).get('name')
+        manifest['profiles'][str(id)] = {'name': name, 'sha256': digest}
+        manifest['written' if written else 'unchanged'] += 1
+    return manifest
 
 # Main Function
 
@@ -101,9 +185,18 @@ def main():
     basejss = args.jssurl
     user = args.username
     password = args.password
-    session = CreateSession(user,password)
-    ids = FetchIDS(basejss, session)
-    config_data = FetchConfigData(basejss, session, ids)  
+    directory_name = CreateDirectory(args.directory_name)
+    session = CreateSession(basejss, user, password, args.workers, limiter=RateLimiterFromArgs(args))
+    EnableProfiling(session, args)
+    ids = IterIDs(basejss, session, "configurationprofiles", args.page_size)
+    config_data = FetchConfigData(basejss, session, ids, args.workers, CacheFromArgs(args), args.refresh)
+    manifest = BackupProfiles(config_data, directory_name, args.compress)
+    manifest['jss_url'] = basejss
+    stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+    manifest_path = WriteManifest(manifest, directory_name, stamp)
+    print("Backed up {} profiles: {} new or changed, {} unchanged. Manifest: {}".format(len(manifest['profiles']), manifest['written'], manifest['unchanged'], manifest_path))
+    if args.package:
+        print("Packaged backup: {}".format(PackageBackup(manifest_path, manifest, directory_name, stamp)))
 
 if __name__ == "__main__":
     main()